@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from core.cache import is_shared_cache
+
+
+def get_token_cache_key(key):
+    return f'auth_token:{key}'
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, запоминающий токен с пользователем в кэше.
+
+    Запись сбрасывается сигналами при удалении токена и сохранении
+    пользователя, иначе живёт TOKEN_CACHE_TIMEOUT секунд. Сброс виден
+    всем воркерам только через общий кэш (CACHES), поэтому с кэшем
+    в памяти процесса токен каждый раз проверяется по базе.
+    """
+
+    def authenticate_credentials(self, key):
+        if not is_shared_cache():
+            return super().authenticate_credentials(key)
+        cache_key = get_token_cache_key(key)
+        credentials = cache.get(cache_key)
+        if credentials is None:
+            credentials = super().authenticate_credentials(key)
+            cache.set(cache_key, credentials, settings.TOKEN_CACHE_TIMEOUT)
+        elif not credentials[0].is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        return credentials
@@ -1,4 +1,5 @@
 from django_filters.rest_framework import FilterSet, filters
+from rest_framework.filters import OrderingFilter
 
 from recipes.models import Ingredient, Recipe, Tag
 
@@ -41,3 +42,29 @@ class RecipeFilter(FilterSet):
         if value and not user.is_anonymous:
             return queryset.filter(shoppingcarts__user=user)
         return queryset
+
+
+class RecipeOrderingFilter(OrderingFilter):
+    """Сортировка рецептов с псевдонимами `popular` и `trending`.
+
+    Счётчики у многих рецептов совпадают, поэтому псевдонимы
+    досортировывают по id: иначе порядок между страницами плавает.
+    """
+    aliases = {
+        'popular': ('-favorites_count', '-id'),
+        'trending': ('-trending_score', '-id'),
+    }
+
+    def get_ordering(self, request, queryset, view):
+        params = request.query_params.get(self.ordering_param)
+        if params:
+            fields = []
+            for param in params.split(','):
+                param = param.strip()
+                fields.extend(self.aliases.get(param, (param,)))
+            ordering = self.remove_invalid_fields(
+                queryset, fields, view, request
+            )
+            if ordering:
+                return ordering
+        return self.get_default_ordering(view)
@@ -0,0 +1,147 @@
+import json
+import subprocess
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.filters import RecipeFilter
+from api.serializers import RecipeGetSerializer, SubscribeSerializer
+from api.views import RecipeViewSet, UserViewSet
+from core.benchmark import get_host, measure
+from recipes.models import Tag
+from users.models import User
+
+RESULTS_DIR = settings.BASE_DIR / 'benchmarks'
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark serializers, filters and the shopping list download '
+        'on the current database and store the results'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument(
+            '--output',
+            help='Result file, benchmarks/<commit>.json by default'
+        )
+        parser.add_argument(
+            '--compare',
+            help='Result file of a previous run to compare with'
+        )
+
+    def handle(self, *args, **options):
+        self.factory = APIRequestFactory()
+        self.limit = options['limit']
+        user = User.objects.annotate(
+            carts=Count('shoppingcarts', distinct=True),
+            follows=Count('authors', distinct=True),
+        ).order_by('-follows', '-carts').first()
+        if user is None:
+            raise CommandError('Database is empty, run generatedata first')
+        operations = {
+            'RecipeGetSerializer': self.serialize_recipes,
+            'SubscribeSerializer': self.serialize_subscriptions,
+            'RecipeFilter': self.filter_recipes,
+            'download_shopping_cart': self.download_shopping_cart,
+        }
+        results = {}
+        for name, operation in operations.items():
+            results[name] = measure(
+                lambda: operation(user), options['repeat']
+            )
+        report = {
+            'commit': self.get_commit(),
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'limit': self.limit,
+            'results': results,
+        }
+        previous = self.load(options['compare']) if options['compare'] else {}
+        for name, result in results.items():
+            line = (
+                f'{name:<24} median {result["median_ms"]:>9} ms  '
+                f'queries {result["queries"]:>4}  '
+                f'peak {result["peak_kb"]:>9} KiB'
+            )
+            if name in previous:
+                before = previous[name]['median_ms']
+                line += f'  ({result["median_ms"] - before:+.2f} ms)'
+            self.stdout.write(line)
+        output = options['output']
+        if not output:
+            RESULTS_DIR.mkdir(exist_ok=True)
+            output = RESULTS_DIR / f'{report["commit"]}.json'
+        with open(output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Results saved to {output}'))
+
+    @staticmethod
+    def load(path):
+        with open(path, encoding='utf-8') as file:
+            return json.load(file)['results']
+
+    @staticmethod
+    def get_commit():
+        try:
+            return subprocess.run(
+                ('git', 'rev-parse', '--short', 'HEAD'),
+                capture_output=True,
+                check=True,
+                cwd=settings.BASE_DIR,
+                text=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return datetime.now().strftime('%Y%m%d%H%M%S')
+
+    def get_request(self, user):
+        request = self.factory.get('/', HTTP_HOST=get_host())
+        force_authenticate(request, user)
+        return request
+
+    def get_view(self, viewset, action, user):
+        request = Request(self.factory.get('/', HTTP_HOST=get_host()))
+        request.user = user
+        view = viewset(action=action, request=request, kwargs={})
+        view.format_kwarg = None
+        return view
+
+    def serialize_recipes(self, user):
+        view = self.get_view(RecipeViewSet, 'list', user)
+        return RecipeGetSerializer(
+            view.get_queryset()[:self.limit],
+            many=True,
+            context=view.get_serializer_context(),
+        ).data
+
+    def serialize_subscriptions(self, user):
+        view = self.get_view(UserViewSet, 'subscriptions', user)
+        return SubscribeSerializer(
+            User.objects.filter(subscribers__user=user).annotate(
+                recipes_count=Count('recipes')
+            ).order_by('username')[:self.limit],
+            many=True,
+            context=view.get_serializer_context(),
+        ).data
+
+    def filter_recipes(self, user):
+        view = self.get_view(RecipeViewSet, 'list', user)
+        return list(RecipeFilter(
+            data={
+                'tags': list(Tag.objects.values_list('slug', flat=True)[:2]),
+                'is_favorited': True,
+            },
+            queryset=view.get_queryset(),
+            request=view.request,
+        ).qs[:self.limit])
+
+    def download_shopping_cart(self, user):
+        return b''.join(RecipeViewSet.as_view(
+            {'get': 'download_shopping_cart'},
+            **RecipeViewSet.download_shopping_cart.kwargs
+        )(self.get_request(user)))
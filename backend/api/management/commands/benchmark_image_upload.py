@@ -0,0 +1,127 @@
+import base64
+import io
+import json
+import os
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.serializers import RecipeImageField
+from api.views import RecipeViewSet
+from core.benchmark import get_host, measure
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+USERNAME = 'benchmark_image_upload'
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare peak memory of recipe image upload as base64 JSON '
+        'and as multipart/form-data (rolled back afterwards)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        tag = Tag.objects.first()
+        ingredient = Ingredient.objects.first()
+        if tag is None or ingredient is None:
+            self.stdout.write(self.style.ERROR(
+                'No tags or ingredients, run importcsv and generatedata first'
+            ))
+            return
+        content = self.create_image(options['size'])
+        encoded = 'data:image/jpeg;base64,' + base64.b64encode(
+            content
+        ).decode()
+        self.stdout.write(
+            f'image {len(content) / 1024:.1f} KiB, '
+            f'base64 {len(encoded) / 1024:.1f} KiB'
+        )
+        for name, field_class in (
+            ('Base64ImageField', Base64ImageField),
+            ('RecipeImageField', RecipeImageField),
+        ):
+            self.report(name, measure(
+                lambda: field_class().run_validation(encoded),
+                options['repeat'],
+            ))
+        fields = {
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'tags': [tag.id],
+            'ingredients': [{'id': ingredient.id, 'amount': 10}],
+        }
+        bodies = {
+            'json': (
+                json.dumps({**fields, 'image': encoded}),
+                'application/json',
+            ),
+            'multipart': (
+                encode_multipart(BOUNDARY, {
+                    **fields,
+                    'ingredients': json.dumps(fields['ingredients']),
+                    'image': self.named_file(content),
+                }),
+                MULTIPART_CONTENT,
+            ),
+        }
+        view = RecipeViewSet.as_view({'post': 'create'})
+        factory = APIRequestFactory()
+        host = get_host()
+        with transaction.atomic():
+            user = User.objects.create(
+                username=USERNAME, email=f'{USERNAME}@example.com'
+            )
+            for name, (body, content_type) in bodies.items():
+
+                def run():
+                    request = factory.post(
+                        '/api/recipes/',
+                        body,
+                        content_type=content_type,
+                        HTTP_HOST=host,
+                    )
+                    force_authenticate(request, user)
+                    response = view(request)
+                    request.close()
+                    assert response.status_code == 201, response.data
+
+                self.report(f'POST {name}', measure(run, options['repeat']))
+            for image in Recipe.objects.filter(author=user).values_list(
+                'image', flat=True
+            ):
+                if default_storage.exists(image):
+                    default_storage.delete(image)
+            transaction.set_rollback(True)
+
+    def report(self, name, result):
+        self.stdout.write(
+            f'{name:<18} median {result["median_ms"]:>9} ms  '
+            f'peak {result["peak_kb"]:>9} KiB'
+        )
+
+    @staticmethod
+    def create_image(size):
+        """JPEG из шума: плохо сжимается, поэтому файл крупный."""
+        image = Image.frombytes(
+            'RGB', (size, size), os.urandom(size * size * 3)
+        )
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=95)
+        return buffer.getvalue()
+
+    @staticmethod
+    def named_file(content):
+        file = io.BytesIO(content)
+        file.name = 'benchmark.jpg'
+        return file
@@ -0,0 +1,95 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory
+
+from api.paginators import KeysetPagination
+from api.views import RecipeViewSet
+from core.benchmark import get_host, measure
+from recipes.models import Recipe, Tag
+from users.models import User
+
+BENCHMARK_TAG = 'benchmark-pagination'
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare page number and cursor pagination of the recipe feed '
+        'on a synthetic dataset (rolled back afterwards)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=20000)
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--page', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        limit, page = options['limit'], options['page']
+        if options['recipes'] < limit * page:
+            self.stdout.write(self.style.ERROR(
+                f'Need at least {limit * page} recipes for page {page}'
+            ))
+            return
+        with transaction.atomic():
+            self.create_dataset(options['recipes'])
+            view = RecipeViewSet.as_view({'get': 'list'})
+            host = get_host()
+            factory = APIRequestFactory()
+            deep_cursor = self.get_cursor((page - 1) * limit)
+            for tags in ({}, {'tags': BENCHMARK_TAG}):
+                scenarios = (
+                    ('page 1', {'page': 1}),
+                    (f'page {page}', {'page': page}),
+                    ('cursor 1', {'cursor': ''}),
+                    (f'cursor {page}', {'cursor': deep_cursor}),
+                )
+                for name, params in scenarios:
+                    request_params = {'limit': limit, **params, **tags}
+
+                    def run():
+                        return view(factory.get(
+                            '/api/recipes/', request_params, HTTP_HOST=host
+                        )).render()
+
+                    result = measure(run, options['repeat'])
+                    label = f'{name} (tag filter)' if tags else name
+                    self.stdout.write(
+                        f'{label:<28} median {result["median_ms"]:>9} ms  '
+                        f'queries {result["queries"]:>3}  '
+                        f'peak {result["peak_kb"]:>9} KiB'
+                    )
+            transaction.set_rollback(True)
+
+    def create_dataset(self, count):
+        author = User.objects.create(
+            username='benchmark_pagination',
+            email='benchmark_pagination@example.com',
+        )
+        tag = Tag.objects.create(
+            name=BENCHMARK_TAG, slug=BENCHMARK_TAG, color='#0000FF'
+        )
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author=author,
+                    name=f'Рецепт {index}',
+                    image='images/benchmark.png',
+                    text='Описание',
+                    cooking_time=10,
+                ) for index in range(count)
+            ),
+            batch_size=1000,
+        )
+        Recipe.tags.through.objects.bulk_create(
+            (
+                Recipe.tags.through(recipe_id=recipe_id, tag_id=tag.id)
+                for recipe_id in author.recipes.values_list('id', flat=True)
+            ),
+            batch_size=1000,
+        )
+
+    @staticmethod
+    def get_cursor(offset):
+        paginator = KeysetPagination()
+        recipe = Recipe.objects.order_by(*paginator.ordering)[offset - 1]
+        return paginator.encode_cursor(paginator.get_position(recipe))
@@ -0,0 +1,113 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.views import RecipeViewSet
+from core.benchmark import get_host, measure
+from recipes.models import (
+    Ingredient,
+    IngredientAmount,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem
+)
+from users.models import User
+
+FORMATS = ('pdf', 'txt', 'csv', 'json')
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the shopping list download in PDF, text, CSV and JSON '
+        'on a synthetic cart (rolled back afterwards)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        ingredients = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True)
+        )
+        if not ingredients:
+            self.stdout.write(self.style.ERROR(
+                'No ingredients, run importcsv first'
+            ))
+            return
+        with transaction.atomic():
+            user = self.create_cart(
+                ingredients,
+                options['recipes'],
+                options['ingredients_per_recipe'],
+            )
+            view = RecipeViewSet.as_view(
+                {'get': 'download_shopping_cart'},
+                **RecipeViewSet.download_shopping_cart.kwargs
+            )
+            factory = APIRequestFactory()
+            host = get_host()
+            for format in FORMATS:
+
+                def run():
+                    # Без кэша PDF каждый раз формируется заново.
+                    cache.clear()
+                    request = factory.get(
+                        '/api/recipes/download_shopping_cart/',
+                        {'format': format},
+                        HTTP_HOST=host,
+                    )
+                    force_authenticate(request, user)
+                    return b''.join(view(request))
+
+                size = len(run())
+                result = measure(run, options['repeat'])
+                self.stdout.write(
+                    f'{format:<6} median {result["median_ms"]:>9} ms  '
+                    f'queries {result["queries"]:>3}  '
+                    f'peak {result["peak_kb"]:>9} KiB  '
+                    f'size {size / 1024:>9.1f} KiB'
+                )
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def create_cart(ingredients, count, per_recipe):
+        user = User.objects.create(
+            username='benchmark_shopping_list',
+            email='benchmark_shopping_list@example.com',
+        )
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author=user,
+                    name=f'Рецепт {index}',
+                    image='images/benchmark.png',
+                    text='Описание',
+                    cooking_time=10,
+                ) for index in range(count)
+            ),
+            batch_size=1000,
+        )
+        recipes = list(user.recipes.values_list('id', flat=True))
+        IngredientAmount.objects.bulk_create(
+            (
+                IngredientAmount(
+                    recipe_id=recipe,
+                    ingredient_id=ingredients[
+                        (index * per_recipe + offset) % len(ingredients)
+                    ],
+                    amount=offset + 1,
+                )
+                for index, recipe in enumerate(recipes)
+                for offset in range(per_recipe)
+            ),
+            batch_size=1000,
+        )
+        ShoppingCart.objects.bulk_create(
+            (ShoppingCart(user=user, recipe_id=recipe) for recipe in recipes),
+            batch_size=1000,
+        )
+        ShoppingListItem.objects.refresh((user.id,))
+        return user
@@ -0,0 +1,326 @@
+import base64
+import io
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.urls import router_v1
+from core.benchmark import get_host
+from core.query_budget import QueryBudget, QueryBudgetExceeded
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientAmount,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+    TimelineEntry
+)
+from users.models import Subscribe, User
+
+PAGE_SIZES = (1, 50)
+DATASET_SIZE = 60
+PREFIX = 'query_budget'
+
+# Максимальное число SQL-запросов на маршрут из api/urls.py и HTTP-метод.
+# None - маршрут сознательно не проверяется: почтовые сценарии djoser,
+# а также удаление пользователя и смена пароля и имени, которым нужен
+# текущий пароль.
+QUERY_BUDGETS = {
+    ('ingredients-list', 'get'): 2,
+    ('ingredients-detail', 'get'): 2,
+    ('tags-list', 'get'): 2,
+    ('tags-detail', 'get'): 2,
+    ('recipes-list', 'get'): 6,
+    ('recipes-list', 'post'): 14,
+    ('recipes-detail', 'get'): 5,
+    ('recipes-detail', 'put'): 21,
+    ('recipes-detail', 'patch'): 21,
+    ('recipes-detail', 'delete'): 21,
+    ('recipes-download-shopping-cart', 'get'): 3,
+    ('recipes-stream', 'get'): 6,
+    ('recipes-feed', 'get'): 5,
+    ('recipes-bulk-favorite', 'post'): 8,
+    ('recipes-bulk-favorite', 'delete'): 7,
+    ('recipes-bulk-shopping-cart', 'post'): 11,
+    ('recipes-bulk-shopping-cart', 'delete'): 11,
+    ('recipes-favorite', 'post'): 9,
+    ('recipes-favorite', 'delete'): 5,
+    ('recipes-shopping-cart', 'post'): 12,
+    ('recipes-shopping-cart', 'delete'): 9,
+    ('users-list', 'get'): 5,
+    ('users-list', 'post'): 6,
+    ('users-detail', 'get'): 4,
+    ('users-detail', 'put'): 6,
+    ('users-detail', 'patch'): 6,
+    ('users-detail', 'delete'): None,
+    ('users-me', 'get'): 2,
+    ('users-me', 'put'): 6,
+    ('users-me', 'patch'): 6,
+    ('users-me', 'delete'): None,
+    ('users-subscriptions', 'get'): 5,
+    ('users-bulk-subscribe', 'post'): 9,
+    ('users-bulk-subscribe', 'delete'): 7,
+    ('users-subscribe', 'post'): 13,
+    ('users-subscribe', 'delete'): 5,
+    ('users-activation', 'post'): None,
+    ('users-resend-activation', 'post'): None,
+    ('users-reset-password', 'post'): None,
+    ('users-reset-password-confirm', 'post'): None,
+    ('users-reset-username', 'post'): None,
+    ('users-reset-username-confirm', 'post'): None,
+    ('users-set-password', 'post'): None,
+    ('users-set-username', 'post'): None,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Check SQL query budgets of API routes at page sizes 1 and 50 '
+        'on a temporary dataset'
+    )
+
+    def handle(self, *args, **options):
+        missing = sorted(
+            f'{name} {method.upper()}'
+            for name, method in self.get_routes()
+            if (name, method) not in QUERY_BUDGETS
+        )
+        if missing:
+            raise CommandError(
+                'No query budget for routes: ' + ', '.join(missing)
+            )
+        # Данные есть только в незавершённой транзакции основной базы,
+        # поэтому на время проверки реплики отключены.
+        with override_settings(DATABASE_REPLICAS=[]), transaction.atomic():
+            errors = self.check_budgets(self.create_dataset())
+            dataset = Recipe.objects.filter(
+                author__username__startswith=PREFIX
+            )
+            # Файлы с тем же содержимым могут быть у других рецептов.
+            for name in dataset.exclude(
+                image__in=Recipe.objects.exclude(
+                    pk__in=dataset.values('pk')
+                ).values('image')
+            ).values_list('image', flat=True).distinct():
+                if default_storage.exists(name):
+                    default_storage.delete(name)
+            transaction.set_rollback(True)
+        if errors:
+            raise CommandError('\n'.join(errors))
+        self.stdout.write(self.style.SUCCESS('All query budgets are met'))
+
+    @staticmethod
+    def get_routes():
+        for url in router_v1.urls:
+            for method in getattr(url.callback, 'actions', {}):
+                yield url.name, method
+
+    def check_budgets(self, data):
+        errors = []
+        for name, method, url, payload in self.get_scenarios(data):
+            budget = QUERY_BUDGETS[(name, method)]
+            page_sizes = PAGE_SIZES if method == 'get' else (None,)
+            counts = []
+            for page_size in page_sizes:
+                params = f'?limit={page_size}' if page_size else ''
+                cache.clear()
+                try:
+                    with QueryBudget(budget) as queries:
+                        response = getattr(data['client'], method)(
+                            url + params, payload, format='json'
+                        )
+                        if response.streaming:
+                            b''.join(response.streaming_content)
+                except QueryBudgetExceeded as error:
+                    errors.append(f'{method.upper()} {url}{params}: {error}')
+                    continue
+                if response.status_code >= 400:
+                    errors.append(
+                        f'{method.upper()} {url}{params}: '
+                        f'status {response.status_code}'
+                    )
+                counts.append(len(queries))
+                self.stdout.write(
+                    f'{method.upper():<6} {url + params:<45} '
+                    f'{len(queries):>3} / {budget}'
+                )
+            if len(set(counts)) > 1:
+                errors.append(
+                    f'{method.upper()} {url}: query count depends on page '
+                    f'size {dict(zip(page_sizes, counts))}'
+                )
+        return errors
+
+    @staticmethod
+    def get_scenarios(data):
+        recipe, author = data['recipe'].id, data['author'].id
+        yield 'ingredients-list', 'get', '/api/ingredients/', None
+        yield (
+            'ingredients-detail', 'get',
+            f'/api/ingredients/{data["ingredients"][0].id}/', None
+        )
+        yield 'tags-list', 'get', '/api/tags/', None
+        yield 'tags-detail', 'get', f'/api/tags/{data["tag"].id}/', None
+        yield 'recipes-list', 'get', '/api/recipes/', None
+        yield 'recipes-detail', 'get', f'/api/recipes/{recipe}/', None
+        yield (
+            'recipes-download-shopping-cart', 'get',
+            '/api/recipes/download_shopping_cart/', None
+        )
+        yield 'recipes-stream', 'get', '/api/recipes/stream/', None
+        yield 'recipes-feed', 'get', '/api/recipes/feed/', None
+        for route in ('favorite', 'shopping_cart'):
+            name = 'recipes-' + route.replace('_', '-')
+            url = f'/api/recipes/{recipe}/{route}/'
+            yield name, 'delete', url, None
+            yield name, 'post', url, {}
+        recipes = [
+            recipe.id for recipe in data['recipes'][:settings.MAX_BULK_SIZE]
+        ]
+        for route in ('bulk_favorite', 'bulk_shopping_cart'):
+            name = 'recipes-' + route.replace('_', '-')
+            url = f'/api/recipes/{route}/'
+            yield name, 'delete', url, {'ids': recipes}
+            yield name, 'post', url, {'ids': recipes}
+        yield 'users-list', 'get', '/api/users/', None
+        yield 'users-detail', 'get', f'/api/users/{author}/', None
+        yield 'users-me', 'get', '/api/users/me/', None
+        profile = {
+            'email': data['user'].email,
+            'username': data['user'].username,
+            'first_name': PREFIX,
+            'last_name': PREFIX,
+        }
+        for method in ('put', 'patch'):
+            yield 'users-me', method, '/api/users/me/', profile
+            yield (
+                'users-detail', method, f'/api/users/{data["user"].id}/',
+                profile
+            )
+        yield 'users-list', 'post', '/api/users/', {
+            'email': f'{PREFIX}_new@example.com',
+            'username': f'{PREFIX}_new',
+            'first_name': PREFIX,
+            'last_name': PREFIX,
+            'password': 'Hf7-qLw2-Zp9x',
+        }
+        yield 'users-subscriptions', 'get', '/api/users/subscriptions/', None
+        subscribe = f'/api/users/{author}/subscribe/'
+        yield 'users-subscribe', 'delete', subscribe, None
+        yield 'users-subscribe', 'post', subscribe, {}
+        authors = {'ids': [author.id for author in data['authors']]}
+        url = '/api/users/bulk_subscribe/'
+        yield 'users-bulk-subscribe', 'delete', url, authors
+        yield 'users-bulk-subscribe', 'post', url, authors
+        recipe_data = {
+            'tags': [data['tag'].id],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 10}
+                for ingredient in data['ingredients'][:10]
+            ],
+            'image': data['image'],
+            'name': PREFIX,
+            'text': PREFIX,
+            'cooking_time': 10,
+        }
+        updated, deleted = data['own_recipes'][:2]
+        yield 'recipes-list', 'post', '/api/recipes/', recipe_data
+        yield (
+            'recipes-detail', 'put', f'/api/recipes/{updated.id}/',
+            recipe_data
+        )
+        yield (
+            'recipes-detail', 'patch', f'/api/recipes/{updated.id}/', {
+                **recipe_data,
+                'ingredients': [
+                    {**ingredient, 'amount': 20}
+                    for ingredient in recipe_data['ingredients']
+                ],
+            }
+        )
+        yield 'recipes-detail', 'delete', f'/api/recipes/{deleted.id}/', None
+
+    @staticmethod
+    def create_dataset():
+        User.objects.bulk_create(
+            User(
+                username=f'{PREFIX}_{index}',
+                email=f'{PREFIX}_{index}@example.com',
+            ) for index in range(DATASET_SIZE)
+        )
+        users = list(User.objects.filter(username__startswith=PREFIX))
+        user, authors = users[0], users[1:]
+        user.is_staff = True
+        user.save()
+        tag = Tag.objects.create(name=PREFIX, slug=PREFIX, color='#0000FF')
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'{PREFIX}_{index}', measurement_unit='г')
+            for index in range(DATASET_SIZE)
+        )
+        ingredients = list(
+            Ingredient.objects.filter(name__startswith=PREFIX)
+        )
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=users[index % len(users)],
+                name=f'{PREFIX}_{index}',
+                image=f'images/{PREFIX}.png',
+                text=PREFIX,
+                cooking_time=10,
+            ) for index in range(DATASET_SIZE * 2)
+        )
+        recipes = list(Recipe.objects.filter(name__startswith=PREFIX))
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tag.id)
+            for recipe in recipes
+        )
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(recipe=recipe, ingredient=ingredient, amount=5)
+            for index, recipe in enumerate(recipes)
+            for ingredient in ingredients[index % 10:index % 10 + 3]
+        )
+        for model in (Favorite, ShoppingCart):
+            model.objects.bulk_create(
+                model(user=user, recipe=recipe) for recipe in recipes
+            )
+        ShoppingListItem.objects.refresh((user.id,))
+        Recipe.objects.filter(
+            pk__in=[recipe.id for recipe in recipes]
+        ).reconcile_favorites_count()
+        Subscribe.objects.bulk_create(
+            Subscribe(user=user, author=author) for author in authors
+        )
+        TimelineEntry.objects.rebuild((user.id,))
+        client = APIClient(HTTP_HOST=get_host())
+        client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user)}'
+        )
+        image = io.BytesIO()
+        Image.new('RGB', (1, 1)).save(image, 'PNG')
+        return {
+            'client': client,
+            'user': user,
+            'author': authors[0],
+            'authors': authors,
+            'recipes': recipes,
+            'recipe': next(
+                recipe for recipe in recipes if recipe.author != user
+            ),
+            'own_recipes': [
+                recipe for recipe in recipes if recipe.author == user
+            ],
+            'tag': tag,
+            'ingredients': ingredients,
+            'image': 'data:image/png;base64,' + base64.b64encode(
+                image.getvalue()
+            ).decode(),
+        }
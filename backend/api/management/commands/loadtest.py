@@ -0,0 +1,261 @@
+import base64
+import io
+import json
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from recipes.management.commands.generatedata import PASSWORD
+
+SCENARIOS = {
+    'browse': 5,
+    'toggle': 3,
+    'subscriptions': 2,
+    'create': 1,
+    'download': 1,
+}
+AUTH_SCENARIOS = ('toggle', 'subscriptions', 'create', 'download')
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, rank):
+    """Перцентиль по методу ближайшего ранга."""
+    values = sorted(values)
+    return values[max(math.ceil(rank / 100 * len(values)) - 1, 0)]
+
+
+class VirtualUser:
+    """Клиент, проигрывающий сценарии фронтенда против запущенного API."""
+
+    def __init__(self, base_url, stats, catalogue, rng, credentials=None):
+        self.base_url = base_url.rstrip('/')
+        self.stats = stats
+        self.catalogue = catalogue
+        self.rng = rng
+        self.session = requests.Session()
+        if credentials:
+            response = self.session.post(
+                f'{self.base_url}/api/auth/token/login/',
+                json={'email': credentials[0], 'password': credentials[1]},
+            )
+            response.raise_for_status()
+            self.session.headers['Authorization'] = (
+                f'Token {response.json()["auth_token"]}'
+            )
+
+    def call(self, method, route, path=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            status = self.session.request(
+                method, self.base_url + (path or route), **kwargs
+            ).status_code
+        except requests.RequestException:
+            status = None
+        self.stats.add(
+            f'{method} {route}', time.perf_counter() - start, status
+        )
+        return status
+
+    def recipe(self):
+        return self.rng.choice(self.catalogue['recipes'])
+
+    def browse(self):
+        tags = self.rng.sample(
+            self.catalogue['tags'],
+            self.rng.randint(0, len(self.catalogue['tags']))
+        )
+        self.call('GET', '/api/recipes/', params={
+            'page': self.rng.randint(1, 10), 'limit': 6, 'tags': tags
+        })
+        self.call('GET', '/api/tags/')
+        recipe = self.recipe()
+        self.call('GET', '/api/recipes/{id}/', f'/api/recipes/{recipe}/')
+
+    def toggle(self):
+        route = self.rng.choice(('favorite', 'shopping_cart'))
+        recipe = self.recipe()
+        path = f'/api/recipes/{recipe}/{route}/'
+        template = f'/api/recipes/{{id}}/{route}/'
+        self.call('POST', template, path)
+        self.call('DELETE', template, path)
+        self.call('GET', '/api/recipes/', params={
+            'is_favorited': 1, 'limit': 6
+        })
+
+    def subscriptions(self):
+        self.call('GET', '/api/users/subscriptions/', params={
+            'limit': 6, 'recipes_limit': 3
+        })
+        author = self.rng.choice(self.catalogue['authors'])
+        path = f'/api/users/{author}/subscribe/'
+        self.call('POST', '/api/users/{id}/subscribe/', path)
+        self.call('DELETE', '/api/users/{id}/subscribe/', path)
+
+    def create(self):
+        self.call('POST', '/api/recipes/', json={
+            'tags': self.catalogue['tag_ids'][:1],
+            'ingredients': [
+                {'id': ingredient, 'amount': self.rng.randint(1, 500)}
+                for ingredient in self.rng.sample(
+                    self.catalogue['ingredients'],
+                    min(8, len(self.catalogue['ingredients']))
+                )
+            ],
+            'image': self.catalogue['image'],
+            'name': 'Нагрузочный тест',
+            'text': 'Рецепт из нагрузочного теста',
+            'cooking_time': self.rng.randint(1, 180),
+        })
+
+    def download(self):
+        self.call('POST', '/api/recipes/{id}/shopping_cart/',
+                  f'/api/recipes/{self.recipe()}/shopping_cart/')
+        self.call('GET', '/api/recipes/download_shopping_cart/')
+
+
+class Stats:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.client_errors = defaultdict(int)
+
+    def add(self, endpoint, elapsed, status):
+        with self.lock:
+            self.timings[endpoint].append(elapsed)
+            if status is None or status >= 500:
+                self.errors[endpoint] += 1
+            elif status >= 400:
+                self.client_errors[endpoint] += 1
+
+    def report(self, duration):
+        report = {}
+        for endpoint in sorted(self.timings):
+            timings = self.timings[endpoint]
+            report[endpoint] = {
+                'requests': len(timings),
+                'throughput_rps': round(len(timings) / duration, 2),
+                'error_rate': round(self.errors[endpoint] / len(timings), 4),
+                'client_errors': self.client_errors[endpoint],
+                **{
+                    f'p{rank}_ms': round(percentile(timings, rank) * 1000, 2)
+                    for rank in PERCENTILES
+                },
+            }
+        return report
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay frontend traffic against a running backend and report '
+        'latency percentiles, throughput and error rate per endpoint'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://localhost:8000')
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument(
+            '--duration', type=int, default=60, help='Seconds'
+        )
+        parser.add_argument(
+            '--scenario', action='append', choices=SCENARIOS,
+            help='Scenario to run, may be repeated; all by default'
+        )
+        parser.add_argument(
+            '--users', type=int, default=0,
+            help='Log in as generated users generated<seed>_<n> '
+                 '(see generatedata); anonymous only when 0'
+        )
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='Write the JSON report here')
+
+    def handle(self, *args, **options):
+        scenarios = options['scenario'] or list(SCENARIOS)
+        if options['users'] == 0:
+            scenarios = [
+                scenario for scenario in scenarios
+                if scenario not in AUTH_SCENARIOS
+            ]
+        if not scenarios:
+            raise CommandError('Authenticated scenarios need --users')
+        catalogue = self.load_catalogue(options['base_url'])
+        stats = Stats()
+        deadline = time.monotonic() + options['duration']
+
+        def worker(number):
+            rng = random.Random(options['seed'] * 1000 + number)
+            credentials = None
+            if options['users']:
+                user = number % options['users']
+                credentials = (
+                    f'generated{options["seed"]}_{user}@example.com',
+                    PASSWORD,
+                )
+            client = VirtualUser(
+                options['base_url'], stats, catalogue, rng, credentials
+            )
+            weights = [SCENARIOS[scenario] for scenario in scenarios]
+            while time.monotonic() < deadline:
+                getattr(client, rng.choices(scenarios, weights)[0])()
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            for future in [
+                executor.submit(worker, number)
+                for number in range(options['concurrency'])
+            ]:
+                future.result()
+        duration = time.monotonic() - start
+        report = {
+            'base_url': options['base_url'],
+            'concurrency': options['concurrency'],
+            'duration_s': round(duration, 1),
+            'scenarios': sorted(scenarios),
+            'endpoints': stats.report(duration),
+        }
+        for endpoint, result in report['endpoints'].items():
+            self.stdout.write(
+                f'{endpoint:<45} n={result["requests"]:<6} '
+                f'{result["throughput_rps"]:>8} rps  '
+                + '  '.join(
+                    f'p{rank} {result[f"p{rank}_ms"]:>8} ms'
+                    for rank in PERCENTILES
+                )
+                + f'  errors {result["error_rate"]:.2%}'
+            )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, indent=2, ensure_ascii=False)
+
+    @staticmethod
+    def load_catalogue(base_url):
+        base_url = base_url.rstrip('/')
+        recipes = requests.get(
+            f'{base_url}/api/recipes/', params={'limit': 100}
+        ).json()['results']
+        tags = requests.get(f'{base_url}/api/tags/').json()
+        ingredients = requests.get(
+            f'{base_url}/api/ingredients/', params={'name': 'а'}
+        ).json()
+        if not recipes or not tags or not ingredients:
+            raise CommandError('Load data first: importcsv and generatedata')
+        image = io.BytesIO()
+        Image.new('RGB', (600, 400), '#e26c2d').save(image, 'JPEG')
+        return {
+            'recipes': [recipe['id'] for recipe in recipes],
+            'authors': sorted({recipe['author']['id'] for recipe in recipes}),
+            'tags': [tag['slug'] for tag in tags],
+            'tag_ids': [tag['id'] for tag in tags],
+            'ingredients': [ingredient['id'] for ingredient in ingredients],
+            'image': 'data:image/jpeg;base64,' + base64.b64encode(
+                image.getvalue()
+            ).decode(),
+        }
@@ -1,6 +1,159 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from core.constant import PAGE_LIMIT_PAGINATION
+
+
+class KeysetPagination(BasePagination):
+    """Постраничный вывод по ключу сортировки без OFFSET и COUNT(*).
+
+    Курсор хранит значения полей `ordering` последней записи страницы,
+    следующая страница выбирается условием по этим полям.
+    """
+    page_size = PAGE_LIMIT_PAGINATION
+    page_size_query_param = 'limit'
+    max_page_size = settings.MAX_PAGE_SIZE
+    cursor_query_param = 'cursor'
+    ordering = ('-pub_date', '-id')
+    invalid_cursor_message = 'Неверный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = self.get_ordering(view)
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request, queryset.model)
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(position))
+        page = list(queryset[:self.page_size + 1])
+        self.next_position = None
+        if len(page) > self.page_size:
+            page = page[:self.page_size]
+            self.next_position = self.get_position(page[-1])
+        return page
+
+    def get_ordering(self, view):
+        return getattr(view, 'cursor_ordering', self.ordering)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.next_position),
+        )
+
+    def get_position(self, obj):
+        return [
+            getattr(obj, field.lstrip('-')) for field in self.ordering
+        ]
+
+    def get_keyset_filter(self, position, ordering=None):
+        ordering = ordering or self.ordering
+        conditions = []
+        for index, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition = Q(**{f'{name}__{lookup}': position[index]})
+            for previous, value in zip(ordering[:index], position):
+                condition &= Q(**{previous.lstrip('-'): value})
+            conditions.append(condition)
+        return reduce(or_, conditions)
+
+    def encode_cursor(self, position):
+        values = [
+            value.isoformat() if hasattr(value, 'isoformat') else value
+            for value in position
+        ]
+        return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(urlsafe_b64decode(encoded.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class FeedPagination(KeysetPagination):
+    """Курсорная пагинация ленты, собранной из нескольких выборок.
+
+    Источники ленты берутся из `view.get_feed_sources()`: пары
+    (queryset, поле id рецепта) с полем `pub_date`. Из каждого источника
+    берётся не больше страницы после курсора, поэтому время ответа
+    не зависит от числа подписок.
+    """
+
+    def get_ordering(self, view):
+        return type(self).ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.ordering = self.get_ordering(view)
+        position = self.decode_cursor(request, queryset.model)
+        page_size = self.get_page_size(request)
+        condition = Q(pk__in=[])
+        for source, id_field in view.get_feed_sources():
+            ordering = ('-pub_date', f'-{id_field}')
+            source = source.order_by(*ordering)
+            if position is not None:
+                source = source.filter(
+                    self.get_keyset_filter(position, ordering)
+                )
+            condition |= Q(pk__in=source.values(id_field)[:page_size + 1])
+        return super().paginate_queryset(
+            queryset.filter(condition), request, view
+        )
 
 
 class PageLimitPagination(PageNumberPagination):
-    page_size = 6
+    """Нумерация страниц с переходом на курсор при наличии `?cursor=`."""
+    page_size = PAGE_LIMIT_PAGINATION
     page_size_query_param = 'limit'
+    max_page_size = settings.MAX_PAGE_SIZE
+    keyset_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.keyset_class.cursor_query_param in request.query_params:
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
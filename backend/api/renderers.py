@@ -0,0 +1,37 @@
+from rest_framework import renderers
+
+
+class ShoppingListRenderer(renderers.BaseRenderer):
+    """Согласование формата списка покупок.
+
+    Файл формирует само действие, рендерер нужен только для выбора
+    формата по заголовку Accept или параметру `?format=`. Ответы
+    с ошибкой RecipeViewSet отдаёт через JSONRenderer.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, bytes):
+            return data
+        return renderers.JSONRenderer().render(data)
+
+
+class PDFRenderer(ShoppingListRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+
+class TextRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class JSONStreamRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
@@ -1,15 +1,32 @@
-from django.db import models
+import base64
+import binascii
+import json
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import (
+    TemporaryUploadedFile,
+    UploadedFile
+)
+from django.db import IntegrityError, transaction
+from django.db.models import Count
+from django.http import QueryDict
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers, status
+from rest_framework.settings import api_settings
 
-from core.constant import MAX_SCORE, MIN_SCORE
+from core.constant import MAX_RECIPES_LIMIT, MAX_SCORE, MIN_SCORE
+from recipes.images import IMAGE_FORMATS, IMAGE_VARIANTS
 from recipes.models import (
     Ingredient,
     Favorite,
     IngredientAmount,
     Recipe,
     ShoppingCart,
-    Tag
+    ShoppingListItem,
+    Tag,
+    TimelineEntry
 )
 from users.models import Subscribe, User
 
@@ -43,16 +60,30 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        return (
-            user.is_authenticated
-            and user.authors.filter(author=obj).exists()
-        )
+        return obj.id in self.get_subscribed_ids()
+
+    def get_subscribed_ids(self):
+        """Id авторов, на которых подписан пользователь, один раз за запрос."""
+        request = self.context.get('request')
+        if not hasattr(request, 'subscribed_ids'):
+            user = request.user
+            request.subscribed_ids = set(
+                user.authors.values_list('author_id', flat=True)
+            ) if user.is_authenticated else set()
+        return request.subscribed_ids
+
+
+class SubscribeListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        authors = list(data)
+        self.child.attach_recipes(authors)
+        return super().to_representation(authors)
 
 
 class SubscribeSerializer(UserSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta(UserSerializer.Meta):
         fields = UserSerializer.Meta.fields + (
@@ -65,24 +96,72 @@ class SubscribeSerializer(UserSerializer):
             'first_name',
             'last_name'
         )
+        list_serializer_class = SubscribeListSerializer
+
+    def to_representation(self, author):
+        if not hasattr(author, 'latest_recipes'):
+            self.attach_recipes([author])
+        return super().to_representation(author)
+
+    def get_recipes_limit(self):
+        limit = self.context.get('request').query_params.get(
+            'recipes_limit'
+        ) or MAX_RECIPES_LIMIT
+        try:
+            return serializers.IntegerField(
+                min_value=1,
+                max_value=MAX_RECIPES_LIMIT,
+            ).run_validation(limit)
+        except serializers.ValidationError as error:
+            raise serializers.ValidationError(
+                {'recipes_limit': error.detail}
+            )
+
+    def attach_recipes(self, authors):
+        """Последние рецепты всех авторов страницы одним запросом."""
+        if not authors:
+            return
+        latest_recipes = defaultdict(list)
+        for recipe in Recipe.objects.filter(
+            author__in=authors
+        ).latest_by_author(self.get_recipes_limit()):
+            latest_recipes[recipe.author_id].append(recipe)
+        for author in authors:
+            author.latest_recipes = latest_recipes[author.id]
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        queryset = obj.recipes.all()
-        if limit:
-            queryset = queryset[:int(limit)]
         return RecipeSerializer(
-            queryset,
+            obj.latest_recipes,
             many=True,
             read_only=True
         ).data
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
 
+class UniqueWriteMixin:
+    """Запись без предварительной проверки на дубликат.
 
-class SubscribeCreateSerializer(serializers.ModelSerializer):
+    Повтор отсекает ограничение уникальности в базе: IntegrityError
+    при вставке строки превращается в ошибку валидации
+    `duplicate_error`. Ошибки последующих записей не перехватываются.
+    """
+    duplicate_error = None
+
+    def create(self, validated_data):
+        # Та же блокировка, что и у пакетных запросов: пакет не примет
+        # строку, вставленную параллельно, за свою.
+        self.Meta.model.objects.lock_user(validated_data['user'])
+        try:
+            with transaction.atomic():
+                return super().create(validated_data)
+        except IntegrityError:
+            raise serializers.ValidationError(self.duplicate_error)
+
+
+class SubscribeCreateSerializer(UniqueWriteMixin, serializers.ModelSerializer):
+    user = serializers.HiddenField(default=serializers.CurrentUserDefault())
+    duplicate_error = {
+        api_settings.NON_FIELD_ERRORS_KEY: ['Подписка уже существует']
+    }
 
     class Meta:
         fields = '__all__'
@@ -91,11 +170,6 @@ class SubscribeCreateSerializer(serializers.ModelSerializer):
     def validate(self, data):
         author = data.get('author')
         user = data.get('user')
-        if user.authors.filter(author=author).exists():
-            raise serializers.ValidationError(
-                detail='Подписка уже существует',
-                code=status.HTTP_400_BAD_REQUEST,
-            )
         if user == author:
             raise serializers.ValidationError(
                 detail='Нельзя подписаться на самого себя',
@@ -103,17 +177,60 @@ class SubscribeCreateSerializer(serializers.ModelSerializer):
             )
         return data
 
+    @transaction.atomic
+    def create(self, validated_data):
+        subscribe = super().create(validated_data)
+        TimelineEntry.objects.backfill(
+            subscribe.user_id, (subscribe.author_id,)
+        )
+        return subscribe
+
     def to_representation(self, instance):
         return SubscribeSerializer(
-            instance.author,
+            User.objects.annotate(
+                recipes_count=Count('recipes')
+            ).get(pk=instance.author_id),
             context=self.context
         ).data
 
 
-class IngredientAmountSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(),
+class BulkIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.MAX_BULK_SIZE,
     )
+
+
+def get_objects(queryset, pks):
+    """Объекты по списку id одним запросом in_bulk.
+
+    Отсутствующие id перечисляются в одной ошибке.
+    """
+    objects = queryset.in_bulk(pks)
+    missing = sorted(set(pks) - objects.keys())
+    if missing:
+        raise serializers.ValidationError(
+            'Не найдены объекты с id: '
+            + ', '.join(str(pk) for pk in missing)
+        )
+    return [objects[pk] for pk in pks]
+
+
+class PrimaryKeyListField(serializers.ListField):
+    """Список id, который проверяется одним запросом."""
+    child = serializers.IntegerField(min_value=1)
+
+    def __init__(self, queryset, **kwargs):
+        self.queryset = queryset
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        return get_objects(self.queryset, super().to_internal_value(data))
+
+
+class IngredientAmountSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(min_value=1)
     amount = serializers.IntegerField(
         min_value=MIN_SCORE,
         max_value=MAX_SCORE,
@@ -124,7 +241,51 @@ class IngredientAmountSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
+class IngredientInRecipeSerializer(serializers.ModelSerializer):
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit'
+    )
+
+    class Meta:
+        model = IngredientAmount
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии изображения рецепта по форматам.
+
+    Пока копии не готовы, для всех вариантов отдаётся оригинал.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        if not recipe.image:
+            return None
+        request = self.context.get('request')
+
+        def get_url(path):
+            url = default_storage.url(path)
+            return request.build_absolute_uri(url) if request else url
+
+        original = get_url(recipe.image.name)
+        return {
+            variant: {
+                extension: get_url(
+                    recipe.image_variants[variant][extension]
+                ) if variant in recipe.image_variants else original
+                for extension in IMAGE_FORMATS
+            }
+            for variant in IMAGE_VARIANTS
+        }
+
+
 class RecipeSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
@@ -132,17 +293,81 @@ class RecipeSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_variants',
             'cooking_time',
         )
 
 
+class RecipeImageField(Base64ImageField):
+    """Изображение файлом из multipart/form-data или строкой base64.
+
+    Строка base64 декодируется частями во временный файл на диске,
+    как файлы из multipart/form-data: Pillow и хранилище работают
+    с ним по пути, и изображение целиком в памяти не держится.
+    """
+    chunk_size = 64 * 1024
+
+    def to_internal_value(self, data):
+        if data in self.EMPTY_VALUES:
+            return None
+        if isinstance(data, str):
+            data = self.decode(data)
+        elif not isinstance(data, UploadedFile):
+            raise serializers.ValidationError(self.INVALID_TYPE_MESSAGE)
+        self.check_size(data.size)
+        return serializers.ImageField.to_internal_value(self, data)
+
+    @staticmethod
+    def check_size(size):
+        if size > settings.MAX_IMAGE_SIZE:
+            raise serializers.ValidationError(
+                'Размер изображения не более '
+                f'{settings.MAX_IMAGE_SIZE // 1024 // 1024} МБ'
+            )
+
+    def decode(self, data):
+        start = data.find(';base64,')
+        start = 0 if start == -1 else start + len(';base64,')
+        file = TemporaryUploadedFile(
+            self.get_file_name(None), None, 0, None
+        )
+        head, rest = b'', ''
+        try:
+            for offset in range(start, len(data), self.chunk_size):
+                chunk = rest + ''.join(
+                    data[offset:offset + self.chunk_size].split()
+                )
+                end = len(chunk) - len(chunk) % 4
+                decoded = base64.b64decode(chunk[:end], validate=True)
+                rest = chunk[end:]
+                file.size += len(decoded)
+                self.check_size(file.size)
+                head = head or decoded
+                file.write(decoded)
+            if rest:
+                raise binascii.Error
+        except binascii.Error:
+            raise serializers.ValidationError(self.INVALID_FILE_MESSAGE)
+        extension = self.get_file_extension(None, head)
+        if extension not in self.ALLOWED_TYPES:
+            raise serializers.ValidationError(self.INVALID_TYPE_MESSAGE)
+        file.name = f'{file.name}.{extension}'
+        file.seek(0)
+        return file
+
+
 class RecipeGetSerializer(serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
     tags = TagSerializer(many=True, read_only=True)
-    ingredients = serializers.SerializerMethodField()
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
+    ingredients = IngredientInRecipeSerializer(
+        source='ingredientamounts',
+        many=True,
+        read_only=True
+    )
+    is_favorited = serializers.BooleanField(read_only=True)
+    is_in_shopping_cart = serializers.BooleanField(read_only=True)
     image = Base64ImageField()
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
@@ -153,45 +378,21 @@ class RecipeGetSerializer(serializers.ModelSerializer):
             'ingredients',
             'is_favorited',
             'is_in_shopping_cart',
+            'favorites_count',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time',
         )
 
-    def get_ingredients(self, recipe):
-        ingredients = recipe.ingredients.values(
-            'id',
-            'name',
-            'measurement_unit',
-            amount=models.F('ingredientamounts__amount')
-        )
-        return ingredients
-
-    def get_is_favorited(self, recipe):
-        user = self.context.get('request').user
-        return (
-            user.is_authenticated
-            and user.favorites.filter(recipe=recipe).exists()
-        )
-
-    def get_is_in_shopping_cart(self, recipe):
-        user = self.context.get('request').user
-        return (
-            user.is_authenticated
-            and user.shoppingcarts.filter(recipe=recipe).exists()
-        )
-
 
 class RecipePostSerializer(serializers.ModelSerializer):
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True
-    )
+    tags = PrimaryKeyListField(queryset=Tag.objects.all())
     ingredients = IngredientAmountSerializer(
         many=True
     )
-    image = Base64ImageField()
+    image = RecipeImageField()
     cooking_time = serializers.IntegerField(
         min_value=MIN_SCORE,
         max_value=MAX_SCORE
@@ -209,6 +410,26 @@ class RecipePostSerializer(serializers.ModelSerializer):
             'cooking_time',
         )
 
+    def to_internal_value(self, data):
+        if isinstance(data, QueryDict):
+            data = self.parse_form(data)
+        return super().to_internal_value(data)
+
+    @staticmethod
+    def parse_form(data):
+        """Поля multipart/form-data: tags списком, ingredients в JSON."""
+        form = {key: data.get(key) for key in data}
+        if 'tags' in data:
+            form['tags'] = data.getlist('tags')
+        if isinstance(form.get('ingredients'), str):
+            try:
+                form['ingredients'] = json.loads(form['ingredients'])
+            except ValueError:
+                raise serializers.ValidationError({
+                    'ingredients': ['Ожидается список ингредиентов в JSON']
+                })
+        return form
+
     def validate(self, data):
         tags = data.get('tags')
         if not tags:
@@ -234,6 +455,15 @@ class RecipePostSerializer(serializers.ModelSerializer):
             })
         return data
 
+    def validate_ingredients(self, value):
+        ingredients = get_objects(
+            Ingredient.objects.all(),
+            [ingredient['id'] for ingredient in value]
+        )
+        for ingredient, obj in zip(value, ingredients):
+            ingredient['id'] = obj
+        return value
+
     def validate_image(self, value):
         if not value:
             raise serializers.ValidationError({
@@ -250,8 +480,10 @@ class RecipePostSerializer(serializers.ModelSerializer):
                 amount=ingredient['amount']
             ) for ingredient in ingredients
         ]
-        IngredientAmount.objects.bulk_create(ingredients_in_recipe)
+        if ingredients_in_recipe:
+            IngredientAmount.objects.bulk_create(ingredients_in_recipe)
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
@@ -260,39 +492,82 @@ class RecipePostSerializer(serializers.ModelSerializer):
             **validated_data)
         recipe.tags.set(tags)
         self.create_recipe_ingredients(recipe, ingredients)
+        TimelineEntry.objects.fan_out(recipe)
         return recipe
 
+    def update_recipe_ingredients(self, recipe, ingredients):
+        """Применяет к ингредиентам рецепта только изменения.
+
+        Возвращает id добавленных, удалённых и изменённых ингредиентов.
+        """
+        current = {
+            amount.ingredient_id: amount
+            for amount in recipe.ingredientamounts.all()
+        }
+        submitted = {
+            ingredient['id'].id: ingredient for ingredient in ingredients
+        }
+        removed = current.keys() - submitted.keys()
+        if removed:
+            IngredientAmount.objects.filter(
+                pk__in=[current[ingredient].pk for ingredient in removed]
+            ).delete()
+        self.create_recipe_ingredients(recipe, [
+            ingredient for pk, ingredient in submitted.items()
+            if pk not in current
+        ])
+        changed = [
+            current[pk] for pk, ingredient in submitted.items()
+            if pk in current and current[pk].amount != ingredient['amount']
+        ]
+        for amount in changed:
+            amount.amount = submitted[amount.ingredient_id]['amount']
+        IngredientAmount.objects.bulk_update(changed, ('amount',))
+        return (
+            removed
+            | (submitted.keys() - current.keys())
+            | {amount.ingredient_id for amount in changed}
+        )
+
+    @transaction.atomic
     def update(self, recipe, validated_data):
-        recipe.tags.clear()
-        recipe.ingredients.clear()
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        recipe.tags.set(tags)
-        self.create_recipe_ingredients(recipe=recipe, ingredients=ingredients)
+        recipe.tags.set(validated_data.pop('tags'))
+        changed_ingredients = self.update_recipe_ingredients(
+            recipe, validated_data.pop('ingredients')
+        )
+        if changed_ingredients:
+            ShoppingListItem.objects.refresh(
+                recipe.shoppingcarts.values('user'), changed_ingredients
+            )
         return super().update(recipe, validated_data)
 
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            # Хранилище перемещает временный файл изображения, закрываем
+            # его сразу, а не при сборке мусора, как Django закрывает
+            # загруженные файлы в конце запроса.
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
+
     def to_representation(self, instance):
         return RecipeGetSerializer(
-            instance,
+            self.context.get('view').get_queryset().get(pk=instance.pk),
             context=self.context
         ).data
 
 
-class ShoppingCartFavoriteSerializer(serializers.ModelSerializer):
+class ShoppingCartFavoriteSerializer(
+    UniqueWriteMixin, serializers.ModelSerializer
+):
+    user = serializers.HiddenField(default=serializers.CurrentUserDefault())
+    duplicate_error = {'error': ['Этот рецепт уже добавлен']}
+
     class Meta:
         fields = ('user', 'recipe')
 
-    def validate(self, data):
-        user, recipe = data.get('user'), data.get('recipe')
-        if self.Meta.model.objects.filter(
-                user=user,
-                recipe=recipe
-        ).exists():
-            raise serializers.ValidationError(
-                {'error': 'Этот рецепт уже добавлен'}
-            )
-        return data
-
     def to_representation(self, instance):
         return RecipeSerializer(
             instance.recipe,
@@ -304,7 +579,22 @@ class FavoriteSerializer(ShoppingCartFavoriteSerializer):
     class Meta(ShoppingCartFavoriteSerializer.Meta):
         model = Favorite
 
+    @transaction.atomic
+    def create(self, validated_data):
+        favorite = super().create(validated_data)
+        Recipe.objects.change_favorites_count(favorite.recipe_id, 1)
+        return favorite
+
 
 class ShoppingCartSerializer(ShoppingCartFavoriteSerializer):
     class Meta(ShoppingCartFavoriteSerializer.Meta):
         model = ShoppingCart
+
+    @transaction.atomic
+    def create(self, validated_data):
+        shopping_cart = super().create(validated_data)
+        ShoppingListItem.objects.refresh(
+            (shopping_cart.user_id,),
+            shopping_cart.recipe.ingredientamounts.values('ingredient')
+        )
+        return shopping_cart
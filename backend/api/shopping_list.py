@@ -0,0 +1,130 @@
+import csv
+import hashlib
+import io
+import json
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from recipes.models import ShoppingListItem
+
+FONT_NAME = 'ArialRegular'
+FONT_PATH = settings.BASE_DIR / 'ArialRegular.ttf'
+PAGE_TOP = 800
+PAGE_BOTTOM = 50
+LINE_HEIGHT = 25
+
+
+def get_ingredients(user):
+    return ShoppingListItem.objects.filter(user=user).values(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+        'amount',
+    ).order_by('ingredient__name')
+
+
+def get_cache_key(user_id):
+    return f'shopping_list_pdf:{user_id}'
+
+
+@lru_cache(maxsize=None)
+def register_font():
+    """Шрифт читается с диска один раз на процесс."""
+    pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH, 'UTF-8'))
+
+
+def create_pdf(ingredients):
+    register_font()
+    buffer = io.BytesIO()
+    page = canvas.Canvas(buffer)
+    page.setFont(FONT_NAME, size=22)
+    page.drawString(200, PAGE_TOP, 'Список ингредиентов')
+    height = PAGE_TOP - 2 * LINE_HEIGHT
+    page.setFont(FONT_NAME, size=12)
+    for i, ingredient in enumerate(ingredients, 1):
+        if height < PAGE_BOTTOM:
+            page.showPage()
+            page.setFont(FONT_NAME, size=12)
+            height = PAGE_TOP
+        page.drawString(
+            75, height, (
+                f'{i}) '
+                f'{ingredient["ingredient__name"].capitalize()} - '
+                f'{ingredient["amount"]} '
+                f'{ingredient["ingredient__measurement_unit"]}'
+            )
+        )
+        height -= LINE_HEIGHT
+    page.showPage()
+    page.save()
+    return buffer.getvalue()
+
+
+def stream_text(ingredients):
+    for i, ingredient in enumerate(ingredients, 1):
+        yield (
+            f'{i}) '
+            f'{ingredient["ingredient__name"].capitalize()} - '
+            f'{ingredient["amount"]} '
+            f'{ingredient["ingredient__measurement_unit"]}\n'
+        )
+
+
+class Echo:
+    """Буфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            ingredient['amount'],
+        ))
+
+
+def stream_json(ingredients):
+    separator = '['
+    for ingredient in ingredients:
+        yield separator + json.dumps({
+            'name': ingredient['ingredient__name'],
+            'measurement_unit': ingredient['ingredient__measurement_unit'],
+            'amount': ingredient['amount'],
+        }, ensure_ascii=False)
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+STREAMS = {
+    'txt': stream_text,
+    'csv': stream_csv,
+    'json': stream_json,
+}
+
+
+def get_shopping_list_pdf(user):
+    """PDF списка покупок из кэша, если состав корзины не изменился."""
+    ingredients = get_ingredients(user)
+    digest = hashlib.sha256()
+    for ingredient in ingredients.iterator():
+        digest.update(repr(tuple(ingredient.values())).encode())
+    digest = digest.hexdigest()
+    cached = cache.get(get_cache_key(user.id))
+    if cached is not None and cached[0] == digest:
+        return cached[1]
+    pdf = create_pdf(ingredients.iterator())
+    cache.set(
+        get_cache_key(user.id),
+        (digest, pdf),
+        settings.SHOPPING_LIST_CACHE_TIMEOUT
+    )
+    return pdf
@@ -0,0 +1,44 @@
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.images import create_variants, variants_are_current
+from recipes.models import Recipe, ShoppingCart
+from users.models import User
+from .authentication import get_token_cache_key
+from .shopping_list import get_cache_key
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def invalidate_shopping_list(sender, instance, **kwargs):
+    cache.delete(get_cache_key(instance.user_id))
+
+
+@receiver(post_save, sender=Recipe)
+def create_image_variants(sender, instance, **kwargs):
+    if instance.image and not variants_are_current(instance):
+        transaction.on_commit(
+            partial(create_variants, instance.pk, instance.image.name)
+        )
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    cache.delete(get_token_cache_key(instance.key))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, created, **kwargs):
+    """Смена пароля, блокировка и правка профиля сбрасывают кэш токена."""
+    if created:
+        return
+    cache.delete_many([
+        get_token_cache_key(key)
+        for key in Token.objects.filter(user=instance).values_list(
+            'key', flat=True
+        )
+    ])
@@ -0,0 +1,392 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .shopping_list import get_cache_key
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientAmount,
+    Recipe,
+    ShoppingCart,
+    Tag
+)
+from users.models import User
+
+ME_URL = '/api/users/me/'
+
+
+def get_token_queries(queries):
+    return [
+        query['sql'] for query in queries
+        if Token._meta.db_table in query['sql']
+    ]
+
+
+# Файловый кэш общий для процессов, как memcached в продакшене.
+SHARED_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.mkdtemp(),
+    }
+}
+
+
+def clear_shared_cache():
+    shutil.rmtree(SHARED_CACHES['default']['LOCATION'], True)
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class CachedTokenAuthenticationTests(TestCase):
+
+    def setUp(self):
+        self.addCleanup(clear_shared_cache)
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='password'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def get_me(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(ME_URL)
+        return response, get_token_queries(context.captured_queries)
+
+    def test_warm_request_skips_token_query(self):
+        response, queries = self.get_me()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+        response, queries = self.get_me()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, [])
+
+    def test_logout_revokes_cached_token(self):
+        self.get_me()
+        response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.client.get(ME_URL).status_code, 401)
+
+    def test_deactivation_revokes_cached_token(self):
+        self.get_me()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(ME_URL).status_code, 401)
+
+    def test_deletion_revokes_cached_token(self):
+        self.get_me()
+        self.user.delete()
+        self.assertEqual(self.client.get(ME_URL).status_code, 401)
+
+    @override_settings(CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    })
+    def test_process_local_cache_is_not_used(self):
+        self.get_me()
+        response, queries = self.get_me()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+})
+class RecipeQueryCountTests(TestCase):
+    """Число запросов списка и карточки рецепта не зависит от данных.
+
+    Кэш в памяти процесса отключает кэширование токена, поэтому его
+    проверка входит в каждый запрос. Бюджеты всех маршрутов проверяет
+    команда check_query_budgets.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='user', email='user@example.com'
+        )
+        tags = [
+            Tag.objects.create(name=name, color='#0000FF', slug=name)
+            for name in ('breakfast', 'dinner')
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'ingredient {index}', measurement_unit='g'
+            )
+            for index in range(3)
+        ]
+        cls.recipes = []
+        for index in range(5):
+            author = User.objects.create(
+                username=f'author{index}', email=f'author{index}@example.com'
+            )
+            recipe = Recipe.objects.create(
+                author=author,
+                name=f'Рецепт {index}',
+                text='Описание',
+                image='images/a.png',
+            )
+            recipe.tags.set(tags)
+            IngredientAmount.objects.bulk_create(
+                IngredientAmount(
+                    recipe=recipe, ingredient=ingredient, amount=10
+                ) for ingredient in ingredients
+            )
+            Favorite.objects.create(user=cls.user, recipe=recipe)
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user)}'
+        )
+
+    def test_list(self):
+        for limit in (1, 5):
+            with self.assertNumQueries(6):
+                response = self.client.get(f'/api/recipes/?limit={limit}')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), limit)
+
+    def test_detail(self):
+        with self.assertNumQueries(5):
+            response = self.client.get(f'/api/recipes/{self.recipes[0].id}/')
+        self.assertEqual(response.status_code, 200)
+
+
+class RecipeOrderingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(
+            username='author', email='author@example.com'
+        )
+        cls.ids = [
+            Recipe.objects.create(
+                author=author,
+                name=f'Рецепт {index}',
+                text='Описание',
+                image='images/a.png',
+            ).id for index in range(5)
+        ]
+
+    def test_aliases_break_ties_by_id(self):
+        for alias in ('popular', 'trending'):
+            with self.subTest(alias=alias):
+                ids = []
+                url = f'/api/recipes/?ordering={alias}&limit=2'
+                while url:
+                    response = APIClient().get(url)
+                    self.assertEqual(response.status_code, 200)
+                    ids.extend(
+                        recipe['id'] for recipe in response.data['results']
+                    )
+                    url = response.data['next']
+                self.assertEqual(ids, sorted(self.ids, reverse=True))
+
+
+class UserEndpointsTests(TestCase):
+    USER_FIELDS = {
+        'email',
+        'id',
+        'username',
+        'first_name',
+        'last_name',
+        'is_subscribed',
+        'recipes',
+        'recipes_count',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='author', email='author@example.com'
+        )
+        for index in range(2):
+            Recipe.objects.create(
+                author=cls.author,
+                name=f'Рецепт {index}',
+                text='Описание',
+                image='images/a.png',
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_list(self):
+        response = self.client.get('/api/users/')
+        self.assertEqual(response.status_code, 200)
+        user, = response.data['results']
+        self.assertEqual(set(user), self.USER_FIELDS)
+        self.assertEqual(user['recipes_count'], 2)
+
+    def test_detail(self):
+        response = self.client.get(f'/api/users/{self.author.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data), self.USER_FIELDS)
+        self.assertEqual(response.data['recipes_count'], 2)
+        self.assertEqual(len(response.data['recipes']), 2)
+
+
+class BulkEndpointsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='user', email='user@example.com'
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.user,
+                name=f'Рецепт {index}',
+                text='Описание',
+                image='images/a.png',
+            ) for index in range(3)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post_bulk(self, route, ids):
+        response = self.client.post(
+            f'/api/recipes/{route}/', {'ids': ids}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return {
+            result['id']: result['status']
+            for result in response.data['results']
+        }
+
+    def test_bulk_favorite_reports_only_new_rows(self):
+        first, second, third = (recipe.id for recipe in self.recipes)
+        Favorite.objects.create(user=self.user, recipe_id=first)
+        Recipe.objects.filter(pk=first).update(favorites_count=1)
+        missing = third + 1
+        self.assertEqual(
+            self.post_bulk('bulk_favorite', [first, second, missing]),
+            {first: 'exists', second: 'created', missing: 'not_found'}
+        )
+        self.assertEqual(
+            self.post_bulk('bulk_favorite', [first, second, third]),
+            {first: 'exists', second: 'exists', third: 'created'}
+        )
+        self.assertEqual(
+            list(Recipe.objects.order_by('id').values_list(
+                'favorites_count', flat=True
+            )),
+            [1, 1, 1]
+        )
+
+    def test_bulk_shopping_cart_invalidates_pdf_cache(self):
+        cache.set(get_cache_key(self.user.id), ('digest', b'pdf'))
+        self.post_bulk('bulk_shopping_cart', [self.recipes[0].id])
+        self.assertIsNone(cache.get(get_cache_key(self.user.id)))
+
+
+class DownloadShoppingCartTests(TestCase):
+
+    def test_errors_are_json(self):
+        for params in ('', '?format=pdf', '?format=csv', '?format=txt'):
+            with self.subTest(params=params):
+                response = APIClient().get(
+                    f'/api/recipes/download_shopping_cart/{params}'
+                )
+                self.assertEqual(response.status_code, 401)
+                self.assertEqual(response['Content-Type'], 'application/json')
+                self.assertIn('detail', response.json())
+
+
+REPLICA = 'replica_test'
+
+
+@override_settings(
+    CACHES=SHARED_CACHES,
+    DATABASE_REPLICAS=[REPLICA],
+    DATABASE_HEALTH_CHECKS={},
+    MIDDLEWARE=[
+        *settings.MIDDLEWARE, 'core.middleware.ReplicaRoutingMiddleware'
+    ],
+)
+class ReplicaRoutingTests(TestCase):
+    """Маршрутизация чтения между двумя отдельными базами SQLite.
+
+    Реплика не зеркалирует default, поэтому по данным ответа видно,
+    из какой базы он прочитан. Тестовый раннер создаёт только базы из
+    настроек, так что реплика подключается на время класса.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.replica_dir = tempfile.mkdtemp()
+        connections.databases[REPLICA] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(cls.replica_dir, 'replica.sqlite3'),
+        }
+        call_command('migrate', database=REPLICA, verbosity=0)
+        cls.create_data(REPLICA)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[REPLICA].close()
+        del connections.databases[REPLICA]
+        shutil.rmtree(cls.replica_dir)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.recipe = cls.create_data('default')
+
+    @staticmethod
+    def create_data(alias):
+        user = User.objects.using(alias).create(
+            username='admin', email='admin@example.com', is_staff=True
+        )
+        Tag.objects.using(alias).create(
+            name=alias, color='#0000FF', slug=alias
+        )
+        return user, Recipe.objects.using(alias).create(
+            author=user, name=alias, text=alias, image='images/a.png'
+        )
+
+    def setUp(self):
+        self.addCleanup(clear_shared_cache)
+        token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def get_tag_names(self, client):
+        return [tag['name'] for tag in client.get('/api/tags/').data]
+
+    def test_safe_requests_read_replica(self):
+        self.assertEqual(self.get_tag_names(APIClient()), [REPLICA])
+        self.assertEqual(self.get_tag_names(self.client), [REPLICA])
+
+    def test_reads_stick_to_default_after_write(self):
+        response = self.client.post(
+            f'/api/recipes/{self.recipe.id}/favorite/'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.get_tag_names(self.client), ['default'])
+        self.assertEqual(self.get_tag_names(APIClient()), [REPLICA])
+
+    def test_streaming_body_reads_replica(self):
+        response = self.client.get('/api/recipes/stream/')
+        self.assertEqual(response.status_code, 200)
+        recipes = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([recipe['name'] for recipe in recipes], [REPLICA])
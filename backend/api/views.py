@@ -1,25 +1,46 @@
 import io
+import json
+from itertools import islice
 
-from django.db.models import Sum
-from django.http import FileResponse
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import (
+    BooleanField,
+    Count,
+    Exists,
+    OuterRef,
+    Prefetch,
+    Value
+)
+from django.http import FileResponse, Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet as BaseUserViewSet
 from django_filters.rest_framework import DjangoFilterBackend
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import (
+    IsAdminUser,
     IsAuthenticated,
     IsAuthenticatedOrReadOnly
 )
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
 
-from .filters import IngredientFilter, RecipeFilter
-from .paginators import PageLimitPagination
+from .filters import IngredientFilter, RecipeFilter, RecipeOrderingFilter
+from .paginators import FeedPagination, PageLimitPagination
 from .permissions import IsAdminOrAuthorOrReadOnly
+from .renderers import (
+    CSVRenderer,
+    JSONStreamRenderer,
+    PDFRenderer,
+    ShoppingListRenderer,
+    TextRenderer
+)
 from .serializers import (
+    BulkIdsSerializer,
     IngredientSerializer,
     FavoriteSerializer,
     RecipeGetSerializer,
@@ -29,17 +50,51 @@ from .serializers import (
     SubscribeSerializer,
     TagSerializer,
 )
+from .shopping_list import (
+    STREAMS,
+    get_cache_key,
+    get_ingredients,
+    get_shopping_list_pdf
+)
 from recipes.models import (
     Ingredient,
     IngredientAmount,
     Favorite,
     Recipe,
     ShoppingCart,
-    Tag
+    ShoppingListItem,
+    Tag,
+    TimelineEntry
 )
 from users.models import Subscribe, User
 
 
+def get_bulk_ids(request):
+    """Id из тела пакетного запроса без повторов, в исходном порядке."""
+    serializer = BulkIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    return list(dict.fromkeys(serializer.validated_data['ids']))
+
+
+def get_bulk_results(ids, found, done, done_status, skipped_status):
+    """Итог пакетной операции по каждому id.
+
+    found - существующие объекты, done - изменённые операцией.
+    """
+    return Response({
+        'results': [
+            {
+                'id': pk,
+                'status': (
+                    done_status if pk in done
+                    else skipped_status if pk in found
+                    else 'not_found'
+                ),
+            } for pk in ids
+        ]
+    })
+
+
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
@@ -53,11 +108,19 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
 
 
 class UserViewSet(BaseUserViewSet):
-    queryset = User.objects.all()
+    queryset = User.objects.order_by('username')
     serializer_class = SubscribeSerializer
     pagination_class = PageLimitPagination
+    cursor_ordering = ('username', 'id')
     permission_classes = (IsAuthenticatedOrReadOnly,)
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            # Список и карточка выводятся SubscribeSerializer.
+            return queryset.annotate(recipes_count=Count('recipes'))
+        return queryset
+
     @action(
         detail=True,
         methods=['post'],
@@ -65,10 +128,7 @@ class UserViewSet(BaseUserViewSet):
     )
     def subscribe(self, request, id):
         serializer = SubscribeCreateSerializer(
-            data={
-                'user': request.user.id,
-                'author': id
-            },
+            data={'author': id},
             context={'request': request}
         )
         serializer.is_valid(raise_exception=True)
@@ -79,21 +139,66 @@ class UserViewSet(BaseUserViewSet):
         )
 
     @subscribe.mapping.delete
+    @transaction.atomic
     def delete_subscribe(self, request, id):
-        get_object_or_404(
-            Subscribe,
-            user=request.user,
-            author=get_object_or_404(User, pk=id)
+        deleted, _ = Subscribe.objects.filter(
+            user=request.user, author=id
         ).delete()
+        if not deleted:
+            raise Http404
+        TimelineEntry.objects.filter(user=request.user, author=id).delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=['post'],
+        permission_classes=(IsAuthenticated,)
+    )
+    @transaction.atomic
+    def bulk_subscribe(self, request):
+        ids = get_bulk_ids(request)
+        if request.user.id in ids:
+            raise ValidationError(
+                {'ids': ['Нельзя подписаться на самого себя']}
+            )
+        found = set(
+            User.objects.filter(pk__in=ids).order_by().values_list(
+                'pk', flat=True
+            )
+        )
+        created = Subscribe.objects.bulk_link(
+            request.user, 'author', [pk for pk in ids if pk in found]
+        )
+        if created:
+            TimelineEntry.objects.backfill(request.user.id, created)
+        return get_bulk_results(ids, found, created, 'created', 'exists')
+
+    @bulk_subscribe.mapping.delete
+    @transaction.atomic
+    def bulk_delete_subscribe(self, request):
+        ids = get_bulk_ids(request)
+        found = set(
+            User.objects.filter(pk__in=ids).order_by().values_list(
+                'pk', flat=True
+            )
+        )
+        deleted = Subscribe.objects.bulk_unlink(request.user, 'author', found)
+        TimelineEntry.objects.filter(
+            user=request.user, author__in=deleted
+        ).delete()
+        return get_bulk_results(ids, found, deleted, 'deleted', 'absent')
+
     @action(
         detail=False,
         permission_classes=(IsAuthenticated,)
     )
     def subscriptions(self, request):
         queryset = self.paginate_queryset(
-            User.objects.filter(subscribers__user=request.user)
+            User.objects.filter(
+                subscribers__user=request.user
+            ).annotate(
+                recipes_count=Count('recipes')
+            ).order_by('username')
         )
         serializer = SubscribeSerializer(
             queryset,
@@ -106,17 +211,123 @@ class UserViewSet(BaseUserViewSet):
 class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.select_related(
         'author'
-    ).prefetch_related('tags', 'ingredients')
+    ).prefetch_related(
+        'tags',
+        Prefetch(
+            'ingredientamounts',
+            queryset=IngredientAmount.objects.select_related(
+                'ingredient'
+            ).order_by('ingredient__name'),
+        ),
+    )
     pagination_class = PageLimitPagination
     permission_classes = (IsAdminOrAuthorOrReadOnly,)
-    filter_backends = (DjangoFilterBackend,)
+    filter_backends = (DjangoFilterBackend, RecipeOrderingFilter)
     filterset_class = RecipeFilter
+    ordering_fields = ('pub_date', 'favorites_count', 'trending_score', 'id')
+    ordering = ('-pub_date',)
+
+    @property
+    def cursor_ordering(self):
+        """Ключ курсора: выбранная сортировка и id для однозначности."""
+        ordering = tuple(RecipeOrderingFilter().get_ordering(
+            self.request, self.queryset, self
+        ))
+        if ordering[-1] in ('id', '-id'):
+            return ordering
+        return (*ordering, '-id')
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = super().get_queryset()
+        if user.is_anonymous:
+            return queryset.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField()),
+            )
+        return queryset.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+        )
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        """Ошибки отдаются в JSON, а не в формате списка покупок."""
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if (
+                isinstance(response, Response)
+                and response.status_code >= 400
+                and isinstance(
+                    response.accepted_renderer, ShoppingListRenderer
+                )
+        ):
+            response.accepted_renderer = JSONRenderer()
+            response.accepted_media_type = JSONRenderer.media_type
+        return response
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        users = list(instance.shoppingcarts.values_list('user', flat=True))
+        ingredients = list(
+            instance.ingredientamounts.values_list('ingredient', flat=True)
+        )
+        super().perform_destroy(instance)
+        if users:
+            ShoppingListItem.objects.refresh(users, ingredients)
 
     def get_serializer_class(self):
-        if self.action in ('list', 'retrieve'):
+        if self.action in ('list', 'retrieve', 'stream', 'feed'):
             return RecipeGetSerializer
         return RecipePostSerializer
 
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=(IsAuthenticated,),
+        pagination_class=FeedPagination,
+    )
+    def feed(self, request):
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def get_feed_sources(self):
+        return TimelineEntry.objects.get_sources(self.request.user)
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=(IsAdminUser,)
+    )
+    def stream(self, request):
+        return StreamingHttpResponse(
+            self.stream_json(self.filter_queryset(self.get_queryset())),
+            content_type='application/json'
+        )
+
+    def stream_json(self, queryset):
+        """JSON-массив рецептов, сериализуемый порциями."""
+        chunk_size = settings.STREAM_CHUNK_SIZE
+        ids = queryset.values_list('pk', flat=True).iterator(
+            chunk_size=chunk_size
+        )
+        separator = '['
+        for chunk in iter(lambda: list(islice(ids, chunk_size)), []):
+            recipes = self.get_serializer(
+                queryset.filter(pk__in=chunk), many=True
+            ).data
+            for recipe in recipes:
+                yield separator + json.dumps(
+                    recipe, cls=JSONEncoder, ensure_ascii=False
+                )
+                separator = ','
+        yield '[]' if separator == '[' else ']'
+
     @action(
         detail=True,
         methods=['post'],
@@ -126,8 +337,12 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return self.add_obj(FavoriteSerializer, request, pk)
 
     @favorite.mapping.delete
+    @transaction.atomic
     def delete_favorite(self, request, pk):
-        return self.delete_obj(Favorite, request, pk)
+        response = self.delete_obj(Favorite, request, pk)
+        if response.status_code == status.HTTP_204_NO_CONTENT:
+            Recipe.objects.change_favorites_count(pk, -1)
+        return response
 
     @action(
         detail=True,
@@ -138,58 +353,98 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return self.add_obj(ShoppingCartSerializer, request, pk)
 
     @shopping_cart.mapping.delete
+    @transaction.atomic
     def delete_shopping_cart(self, request, pk):
-        return self.delete_obj(ShoppingCart, request, pk)
+        response = self.delete_obj(ShoppingCart, request, pk)
+        if response.status_code == status.HTTP_204_NO_CONTENT:
+            ShoppingListItem.objects.refresh(
+                (request.user.id,),
+                IngredientAmount.objects.filter(recipe=pk).values(
+                    'ingredient'
+                )
+            )
+        return response
 
     @action(
         detail=False,
-        methods=['get'],
+        methods=['post'],
         permission_classes=(IsAuthenticated,)
     )
-    def download_shopping_cart(self, request):
-        ingredients = IngredientAmount.objects.filter(
-            recipe__shoppingcarts__user=request.user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit',
-        ).annotate(amount=Sum('amount')).order_by('ingredient__name')
-        pdf_file = self.create_pdf(ingredients)
-        return FileResponse(
-            pdf_file,
-            as_attachment=True,
-            filename='shopping_list.pdf'
-        )
+    @transaction.atomic
+    def bulk_favorite(self, request):
+        ids, found, created = self.bulk_add_objs(Favorite, request)
+        Recipe.objects.bulk_change_favorites_count(created, 1)
+        return get_bulk_results(ids, found, created, 'created', 'exists')
+
+    @bulk_favorite.mapping.delete
+    @transaction.atomic
+    def bulk_delete_favorite(self, request):
+        ids, found, deleted = self.bulk_delete_objs(Favorite, request)
+        Recipe.objects.bulk_change_favorites_count(deleted, -1)
+        return get_bulk_results(ids, found, deleted, 'deleted', 'absent')
+
+    @action(
+        detail=False,
+        methods=['post'],
+        permission_classes=(IsAuthenticated,)
+    )
+    @transaction.atomic
+    def bulk_shopping_cart(self, request):
+        ids, found, created = self.bulk_add_objs(ShoppingCart, request)
+        self.refresh_shopping_list(request.user, created)
+        return get_bulk_results(ids, found, created, 'created', 'exists')
+
+    @bulk_shopping_cart.mapping.delete
+    @transaction.atomic
+    def bulk_delete_shopping_cart(self, request):
+        ids, found, deleted = self.bulk_delete_objs(ShoppingCart, request)
+        self.refresh_shopping_list(request.user, deleted)
+        return get_bulk_results(ids, found, deleted, 'deleted', 'absent')
 
     @staticmethod
-    def create_pdf(ingredients):
-        pdfmetrics.registerFont(
-            TTFont('ArialRegular', 'ArialRegular.ttf', 'UTF-8')
-        )
-        buffer = io.BytesIO()
-        page = canvas.Canvas(buffer)
-        page.setFont('ArialRegular', size=22)
-        page.drawString(200, 800, 'Список ингредиентов')
-        height = 750
-        page.setFont('ArialRegular', size=12)
-        for i, ingredient in enumerate(ingredients, 1):
-            page.drawString(
-                75, height, (
-                    f'{i}) '
-                    f'{ingredient["ingredient__name"].capitalize()} - '
-                    f'{ingredient["amount"]} '
-                    f'{ingredient["ingredient__measurement_unit"]}'
+    def refresh_shopping_list(user, recipes):
+        if recipes:
+            # bulk_create не отправляет post_save, сбрасывающий кэш PDF.
+            cache.delete(get_cache_key(user.id))
+            ShoppingListItem.objects.refresh(
+                (user.id,),
+                IngredientAmount.objects.filter(recipe__in=recipes).values(
+                    'ingredient'
                 )
             )
-            height -= 25
-        page.showPage()
-        page.save()
-        buffer.seek(0)
-        return buffer
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(
+            PDFRenderer,
+            TextRenderer,
+            CSVRenderer,
+            JSONStreamRenderer,
+        )
+    )
+    def download_shopping_cart(self, request):
+        renderer = request.accepted_renderer
+        if renderer.format == PDFRenderer.format:
+            return FileResponse(
+                io.BytesIO(get_shopping_list_pdf(request.user)),
+                as_attachment=True,
+                filename='shopping_list.pdf'
+            )
+        response = StreamingHttpResponse(
+            STREAMS[renderer.format](get_ingredients(request.user).iterator()),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}'
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{renderer.format}"'
+        )
+        return response
 
     @staticmethod
     def add_obj(serializer_class, request, pk):
         serializer = serializer_class(
-            data={'user': request.user.id, 'recipe': pk},
+            data={'recipe': pk},
             context={'request': request}
         )
         serializer.is_valid(raise_exception=True)
@@ -201,18 +456,52 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     @staticmethod
     def delete_obj(model, request, pk):
-        obj = model.objects.filter(
-            user=request.user,
-            recipe=get_object_or_404(Recipe, pk=pk)
-        )
-        if obj.exists():
-            obj.delete()
+        deleted, _ = model.objects.filter(
+            user=request.user, recipe=pk
+        ).delete()
+        if deleted:
             return Response(
                 status=status.HTTP_204_NO_CONTENT
             )
+        get_object_or_404(Recipe, pk=pk)
         return Response(
             {
                 'error': 'Рецепт уже удален'
             },
             status=status.HTTP_400_BAD_REQUEST
         )
+
+    @staticmethod
+    def bulk_add_objs(model, request):
+        """Добавляет рецепты из тела запроса одним INSERT.
+
+        Возвращает id из запроса, найденные рецепты и добавленные
+        этим запросом.
+        """
+        ids = get_bulk_ids(request)
+        found = set(
+            Recipe.objects.filter(pk__in=ids).order_by().values_list(
+                'pk', flat=True
+            )
+        )
+        created = model.objects.bulk_link(
+            request.user, 'recipe', [pk for pk in ids if pk in found]
+        )
+        return ids, found, created
+
+    @staticmethod
+    def bulk_delete_objs(model, request):
+        """Удаляет рецепты из тела запроса одним DELETE.
+
+        Возвращает id из запроса, найденные рецепты и удалённые
+        этим запросом.
+        """
+        ids = get_bulk_ids(request)
+        found = set(
+            Recipe.objects.filter(pk__in=ids).order_by().values_list(
+                'pk', flat=True
+            )
+        )
+        return ids, found, model.objects.bulk_unlink(
+            request.user, 'recipe', found
+        )
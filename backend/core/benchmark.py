@@ -0,0 +1,37 @@
+import statistics
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def measure(func, repeat=5):
+    """Медиана времени, число SQL-запросов и пик памяти вызова func."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    with CaptureQueriesContext(connection) as queries:
+        tracemalloc.start()
+        try:
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return {
+        'median_ms': round(statistics.median(timings) * 1000, 2),
+        'min_ms': round(min(timings) * 1000, 2),
+        'queries': len(queries),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def get_host():
+    """Имя хоста из ALLOWED_HOSTS для запросов через тестовый клиент."""
+    return next(
+        (host for host in settings.ALLOWED_HOSTS if host != '*'),
+        'localhost'
+    )
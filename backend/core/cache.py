@@ -0,0 +1,12 @@
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def is_shared_cache(alias=DEFAULT_CACHE_ALIAS):
+    """Кэш alias общий для всех процессов приложения.
+
+    У LocMemCache в каждом процессе своя копия: запись, сброшенная
+    в одном воркере, остаётся в остальных.
+    """
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
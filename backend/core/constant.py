@@ -9,4 +9,5 @@ LENGTH_TAG_COLOR = 7
 LENGTH_USER = 150
 MIN_SCORE = 1
 MAX_SCORE = 10000
+MAX_RECIPES_LIMIT = 100
 PAGE_LIMIT_PAGINATION = 6
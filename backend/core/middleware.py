@@ -0,0 +1,121 @@
+import contextvars
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from rest_framework.authentication import (
+    TokenAuthentication,
+    get_authorization_header
+)
+from rest_framework.permissions import SAFE_METHODS
+
+from .cache import is_shared_cache
+from .query_budget import QueryRecorder
+from .routers import replica_reads
+
+logger = logging.getLogger(__name__)
+
+
+class RepeatedQueryMiddleware:
+    """Предупреждает об одинаковых SQL-запросах внутри одного запроса.
+
+    Подключается только в режиме DEBUG: в лог попадает форма запроса,
+    число повторов и стек кода проекта, из которого запрос был вызван.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        for shape, stacks in recorder.repeated(
+                settings.REPEATED_QUERY_THRESHOLD
+        ):
+            logger.warning(
+                '%s %s: %d repeated queries: %s\n%s',
+                request.method,
+                request.path,
+                len(stacks),
+                shape,
+                stacks[0],
+            )
+        return response
+
+
+def get_sticky_cache_key(key):
+    return f'db_primary:{key}'
+
+
+def iterate_in_context(context, iterator):
+    """Отдаёт элементы iterator, вычисляя каждый внутри context."""
+    iterator = iter(iterator)
+    sentinel = object()
+    while True:
+        item = context.run(next, iterator, sentinel)
+        if item is sentinel:
+            return
+        yield item
+
+
+class ReplicaRoutingMiddleware:
+    """Разрешает чтение с реплик для безопасных запросов к API.
+
+    После успешной записи токен клиента на REPLICA_STICKY_SECONDS
+    секунд отмечается в общем кэше, и с ним запросы читают из default,
+    чтобы сразу видеть свои изменения. Без общего кэша отметку не видят
+    другие воркеры, поэтому с реплик читаются только анонимные запросы.
+
+    Тело потокового ответа читается уже после выхода из middleware,
+    поэтому его итератор выполняется в контексте запроса.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        use_replicas = self.can_read_replicas(request)
+        token = replica_reads.set(use_replicas)
+        try:
+            response = self.get_response(request)
+            if response.streaming and use_replicas:
+                response.streaming_content = iterate_in_context(
+                    contextvars.copy_context(), response.streaming_content
+                )
+        finally:
+            replica_reads.reset(token)
+        if (
+                request.method not in SAFE_METHODS
+                and response.status_code < 400
+        ):
+            key = self.get_token_key(request)
+            if key and is_shared_cache():
+                cache.set(
+                    get_sticky_cache_key(key),
+                    True,
+                    settings.REPLICA_STICKY_SECONDS,
+                )
+        return response
+
+    @staticmethod
+    def get_token_key(request):
+        keyword, _, key = get_authorization_header(
+            request
+        ).decode(errors='replace').partition(' ')
+        key = key.strip()
+        if keyword == TokenAuthentication.keyword and key.isalnum():
+            return key
+        return ''
+
+    def can_read_replicas(self, request):
+        if (
+                request.method not in SAFE_METHODS
+                or not request.path.startswith('/api/')
+        ):
+            return False
+        key = self.get_token_key(request)
+        if not key:
+            return True
+        return is_shared_cache() and not cache.get(get_sticky_cache_key(key))
@@ -0,0 +1,93 @@
+import re
+import traceback
+from collections import defaultdict
+from contextlib import ContextDecorator
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+SQL_PLACEHOLDER_LISTS = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def get_sql_shape(sql):
+    """SQL без литералов и с единым видом списков IN (...)."""
+    sql = SQL_LITERALS.sub('?', sql)
+    return SQL_PLACEHOLDER_LISTS.sub('(...)', sql)
+
+
+def get_repeated_shapes(queries, threshold=2):
+    """Формы SQL, встретившиеся не менее threshold раз, по убыванию."""
+    counter = defaultdict(int)
+    for sql in queries:
+        counter[get_sql_shape(sql)] += 1
+    return sorted(
+        (
+            (shape, count) for shape, count in counter.items()
+            if count >= threshold
+        ),
+        key=lambda item: -item[1]
+    )
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryBudget(ContextDecorator):
+    """Падает, если внутри блока выполнено больше max_queries запросов.
+
+    Используется как контекстный менеджер или декоратор:
+    `with QueryBudget(5): ...` и `@QueryBudget(5)`.
+    """
+
+    def __init__(self, max_queries, using=DEFAULT_DB_ALIAS):
+        self.max_queries = max_queries
+        self.using = using
+
+    def __enter__(self):
+        self.context = CaptureQueriesContext(connections[self.using])
+        self.context.__enter__()
+        return self.context
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.context.__exit__(exc_type, exc_value, exc_traceback)
+        if exc_type is not None or len(self.context) <= self.max_queries:
+            return False
+        queries = [query['sql'] for query in self.context.captured_queries]
+        repeated = ''.join(
+            f'\n  {count}x {shape}'
+            for shape, count in get_repeated_shapes(queries)
+        )
+        raise QueryBudgetExceeded(
+            f'{len(self.context)} queries executed, budget is '
+            f'{self.max_queries}.' + (
+                f' Repeated queries:{repeated}' if repeated else ''
+            )
+        )
+
+
+class QueryRecorder:
+    """Обёртка connection.execute_wrapper, запоминающая SQL и стек вызова."""
+
+    def __init__(self):
+        self.calls = defaultdict(list)
+
+    def __call__(self, execute, sql, params, many, context):
+        self.calls[get_sql_shape(sql)].append(self.get_stack())
+        return execute(sql, params, many, context)
+
+    @staticmethod
+    def get_stack():
+        base_dir = str(settings.BASE_DIR)
+        return ''.join(traceback.format_list([
+            frame for frame in traceback.extract_stack()[:-2]
+            if frame.filename.startswith(base_dir)
+        ]))
+
+    def repeated(self, threshold):
+        return [
+            (shape, stacks) for shape, stacks in self.calls.items()
+            if len(stacks) >= threshold
+        ]
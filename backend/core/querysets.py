@@ -0,0 +1,56 @@
+from django.db import models
+
+
+class UserLinkQuerySet(models.QuerySet):
+    """Связи пользователя с объектами, уникальные по паре полей.
+
+    Записи одного пользователя выполняются под блокировкой его строки
+    (lock_user), поэтому пакетные методы точно знают, какие строки
+    изменил именно этот запрос, и параллельные запросы не считают одну
+    строку дважды.
+    """
+
+    def lock_user(self, user):
+        """Блокирует строку user до конца транзакции."""
+        list(
+            self.model._meta.get_field('user').related_model.objects.filter(
+                pk=user.pk
+            ).select_for_update().values_list('pk', flat=True)
+        )
+
+    def bulk_link(self, user, field, ids):
+        """Создаёт недостающие связи user с ids одним INSERT.
+
+        Возвращает id объектов, связи с которыми созданы этим запросом.
+        Вызывается внутри транзакции.
+        """
+        if not ids:
+            return []
+        self.lock_user(user)
+        existing = set(
+            self.filter(
+                user=user, **{f'{field}__in': ids}
+            ).values_list(field, flat=True)
+        )
+        created = [pk for pk in ids if pk not in existing]
+        self.bulk_create(
+            (self.model(user=user, **{f'{field}_id': pk}) for pk in created),
+            ignore_conflicts=True,
+        )
+        return created
+
+    def bulk_unlink(self, user, field, ids):
+        """Удаляет связи user с ids, возвращает id отвязанных объектов.
+
+        Строки блокируются SELECT ... FOR UPDATE до удаления:
+        параллельный запрос дождётся фиксации и не увидит удалённые.
+        Вызывается внутри транзакции.
+        """
+        links = dict(
+            self.select_for_update().filter(
+                user=user, **{f'{field}__in': ids}
+            ).order_by('pk').values_list(field, 'pk')
+        )
+        if links:
+            self.filter(pk__in=links.values()).delete()
+        return list(links)
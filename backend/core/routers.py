@@ -0,0 +1,55 @@
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+# Можно ли читать с реплики в текущем запросе, выставляет
+# ReplicaRoutingMiddleware.
+replica_reads = ContextVar('replica_reads', default=False)
+
+_health = {}
+
+
+def is_healthy(alias):
+    """Проверка соединения с базой не чаще интервала из настроек."""
+    interval = settings.DATABASE_HEALTH_CHECKS.get(alias)
+    if not interval:
+        return True
+    checked_at, healthy = _health.get(alias, (0, True))
+    if time.monotonic() - checked_at < interval:
+        return healthy
+    connection = connections[alias]
+    try:
+        connection.ensure_connection()
+        healthy = connection.is_usable()
+    except DatabaseError:
+        healthy = False
+    if not healthy:
+        connection.close()
+    _health[alias] = (time.monotonic(), healthy)
+    return healthy
+
+
+class ReplicaRouter:
+    """Чтение в безопасных запросах к API - с реплик, запись - в default.
+
+    Токены всегда читаются из default: только что выданный токен может
+    ещё не дойти до реплики. Недоступные реплики пропускаются.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not replica_reads.get() or model._meta.app_label == 'authtoken':
+            return None
+        replicas = [
+            alias for alias in settings.DATABASE_REPLICAS
+            if is_healthy(alias)
+        ]
+        return random.choice(replicas) if replicas else None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
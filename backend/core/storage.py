@@ -0,0 +1,41 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Файлы именуются хешем содержимого.
+
+    Одинаковые файлы хранятся один раз: повторное сохранение возвращает
+    имя уже записанного файла. Каталог и расширение берутся из
+    исходного имени. Файлы не перезаписываются и не удаляются при смене
+    изображения, неиспользуемые удаляет команда delete_orphan_media.
+    """
+
+    def save(self, name, content, max_length=None):
+        name = self.get_content_name(name, content)
+        if self.exists(name):
+            # Свежая дата изменения защищает файл от удаления как сироты.
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)
+
+    @staticmethod
+    def get_content_name(name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        directory, filename = posixpath.split(name.replace('\\', '/'))
+        extension = posixpath.splitext(filename)[1].lower()
+        return posixpath.join(directory, digest.hexdigest() + extension)
+
+
+def walk_files(storage, path):
+    """Имена всех файлов каталога хранилища, включая вложенные."""
+    directories, files = storage.listdir(path)
+    for name in files:
+        yield posixpath.join(path, name)
+    for directory in directories:
+        yield from walk_files(storage, posixpath.join(path, directory))
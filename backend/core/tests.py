@@ -0,0 +1,41 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, override_settings
+
+from .storage import ContentAddressedStorage
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ContentAddressedStorageTests(SimpleTestCase):
+
+    def setUp(self):
+        self.addCleanup(shutil.rmtree, settings.MEDIA_ROOT, True)
+        self.storage = ContentAddressedStorage()
+
+    def test_same_content_is_stored_once(self):
+        first = self.storage.save('images/a.PNG', ContentFile(b'image'))
+        second = self.storage.save('images/b.png', ContentFile(b'image'))
+        self.assertEqual(first, second)
+        self.assertTrue(first.startswith('images/'))
+        self.assertTrue(first.endswith('.png'))
+        self.assertEqual(
+            os.listdir(os.path.join(settings.MEDIA_ROOT, 'images')),
+            [os.path.basename(first)]
+        )
+
+    def test_different_content_gets_different_names(self):
+        first = self.storage.save('images/a.png', ContentFile(b'first'))
+        second = self.storage.save('images/a.png', ContentFile(b'second'))
+        self.assertNotEqual(first, second)
+        with self.storage.open(first) as file:
+            self.assertEqual(file.read(), b'first')
+
+    def test_saving_duplicate_refreshes_modified_time(self):
+        name = self.storage.save('images/a.png', ContentFile(b'image'))
+        os.utime(self.storage.path(name), (0, 0))
+        self.storage.save('images/b.png', ContentFile(b'image'))
+        self.assertGreater(os.path.getmtime(self.storage.path(name)), 0)
@@ -46,6 +46,11 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+REPEATED_QUERY_THRESHOLD = int(os.getenv('REPEATED_QUERY_THRESHOLD', 3))
+
+if DEBUG:
+    MIDDLEWARE.append('core.middleware.RepeatedQueryMiddleware')
+
 ROOT_URLCONF = 'foodgram_backend.urls'
 
 TEMPLATES = [
@@ -84,9 +89,46 @@ DATABASES_AVAILABLE = {
 database = os.getenv('DATABASE', 'production')
 
 DATABASES = {
-    'default': DATABASES_AVAILABLE[database]
+    'default': {
+        **DATABASES_AVAILABLE[database],
+        'CONN_MAX_AGE': int(os.getenv('CONN_MAX_AGE', 0)),
+    }
+}
+
+# Реплики для чтения через запятую: host[:port] для PostgreSQL,
+# путь к файлу для SQLite.
+DATABASE_REPLICAS = []
+for index, replica in enumerate(
+        filter(None, map(str.strip, os.getenv('DB_REPLICAS', '').split(','))),
+        1
+):
+    host, _, port = replica.partition(':')
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        **(
+            {'NAME': replica} if database == 'test'
+            else {'HOST': host, 'PORT': port or DATABASES['default']['PORT']}
+        ),
+        'CONN_MAX_AGE': int(os.getenv('REPLICA_CONN_MAX_AGE', 0)),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{index}')
+
+# Интервал проверки соединения в секундах, 0 - без проверки.
+DATABASE_HEALTH_CHECKS = {
+    alias: int(os.getenv('DB_HEALTH_CHECK_INTERVAL', 30))
+    for alias in DATABASE_REPLICAS
 }
 
+DATABASE_ROUTERS = ('core.routers.ReplicaRouter',)
+
+# Сколько секунд после записи запросы с тем же токеном читают из основной
+# базы. Отметка хранится в общем кэше (CACHE_LOCATION).
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+
+if DATABASE_REPLICAS:
+    MIDDLEWARE.append('core.middleware.ReplicaRoutingMiddleware')
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME':
@@ -111,10 +153,58 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 }
 
+# Общий для всех процессов кэш, например memcached:
+# CACHE_LOCATION=memcached:11211. Без него у каждого процесса свой кэш
+# в памяти, и токены не кэшируются.
+if os.getenv('CACHE_LOCATION'):
+    CACHES = {
+        'default': {
+            'BACKEND': os.getenv(
+                'CACHE_BACKEND',
+                'django.core.cache.backends.memcached.PyMemcacheCache'
+            ),
+            'LOCATION': os.getenv('CACHE_LOCATION'),
+        }
+    }
+
+TOKEN_CACHE_TIMEOUT = int(os.getenv('TOKEN_CACHE_TIMEOUT', 60 * 5))
+
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 100))
+
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', 500))
+
+SHOPPING_LIST_CACHE_TIMEOUT = int(
+    os.getenv('SHOPPING_LIST_CACHE_TIMEOUT', 60 * 60 * 24)
+)
+
+# Число ячеек счётчика избранного, 0 - счётчик обновляется в рецепте сразу.
+FAVORITES_COUNTER_SHARDS = int(os.getenv('FAVORITES_COUNTER_SHARDS', 0))
+
+TRENDING_WINDOW_DAYS = int(os.getenv('TRENDING_WINDOW_DAYS', 7))
+
+# Рецепты авторов с большим числом подписчиков подмешиваются в ленту
+# при чтении, а не рассылаются по лентам при публикации.
+FEED_FANOUT_MAX_FOLLOWERS = int(os.getenv('FEED_FANOUT_MAX_FOLLOWERS', 1000))
+
+FEED_BACKFILL_LIMIT = int(os.getenv('FEED_BACKFILL_LIMIT', 50))
+
+# Процессы для уменьшенных копий изображений, 0 - обработка в запросе.
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+MAX_IMAGE_SIZE = int(os.getenv('MAX_IMAGE_SIZE', 10 * 1024 * 1024))
+
+# Наибольшее число id в одном запросе к пакетным эндпоинтам.
+MAX_BULK_SIZE = int(os.getenv('MAX_BULK_SIZE', 100))
+
+# Файлы из multipart/form-data пишутся во временный файл по частям.
+FILE_UPLOAD_HANDLERS = (
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+)
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'HIDE_USERS': False,
@@ -142,5 +232,7 @@ STATIC_ROOT = BASE_DIR / 'static'
 
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / MEDIA_URL
+# Файлы именуются хешем содержимого, одинаковые хранятся один раз.
+DEFAULT_FILE_STORAGE = 'core.storage.ContentAddressedStorage'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
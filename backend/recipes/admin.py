@@ -7,6 +7,7 @@ from .models import (
     Favorite,
     Recipe,
     ShoppingCart,
+    ShoppingListItem,
     Tag
 )
 
@@ -45,6 +46,27 @@ class RecipeAdmin(admin.ModelAdmin):
     inlines = (IngredientInline,)
     empty_value_display = '-пусто-'
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if change:
+            ShoppingListItem.objects.refresh(
+                form.instance.shoppingcarts.values('user')
+            )
+
+    def delete_model(self, request, obj):
+        users = list(obj.shoppingcarts.values_list('user', flat=True))
+        super().delete_model(request, obj)
+        ShoppingListItem.objects.refresh(users)
+
+    def delete_queryset(self, request, queryset):
+        users = set(
+            ShoppingCart.objects.filter(
+                recipe__in=queryset
+            ).values_list('user', flat=True)
+        )
+        super().delete_queryset(request, queryset)
+        ShoppingListItem.objects.refresh(users)
+
     @admin.display(description='Тэги')
     def get_tags(self, recipe):
         return ', '.join([tag.name for tag in recipe.tags.all()])
@@ -57,9 +79,9 @@ class RecipeAdmin(admin.ModelAdmin):
             ]
         )
 
-    @admin.display(description='В избранном')
+    @admin.display(description='В избранном', ordering='favorites_count')
     def count_favorites(self, recipe):
-        return recipe.favorites.count()
+        return recipe.favorites_count
 
     @admin.display(description='Изображение')
     def get_image(self, obj):
@@ -71,6 +93,20 @@ class FavoriteAdmin(admin.ModelAdmin):
     list_display = ('pk', 'user', 'recipe',)
     search_fields = ('user', 'recipe',)
 
+    def save_model(self, request, obj, form, change):
+        recipes = {obj.recipe_id, form.initial.get('recipe')} - {None}
+        super().save_model(request, obj, form, change)
+        Recipe.objects.filter(pk__in=recipes).reconcile_favorites_count()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        Recipe.objects.filter(pk=obj.recipe_id).reconcile_favorites_count()
+
+    def delete_queryset(self, request, queryset):
+        recipes = set(queryset.values_list('recipe', flat=True))
+        super().delete_queryset(request, queryset)
+        Recipe.objects.filter(pk__in=recipes).reconcile_favorites_count()
+
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
@@ -91,3 +127,17 @@ class IngredientAdmin(admin.ModelAdmin):
 @admin.register(ShoppingCart)
 class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('pk', 'user', 'recipe',)
+
+    def save_model(self, request, obj, form, change):
+        users = {obj.user_id, form.initial.get('user')} - {None}
+        super().save_model(request, obj, form, change)
+        ShoppingListItem.objects.refresh(users)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        ShoppingListItem.objects.refresh((obj.user_id,))
+
+    def delete_queryset(self, request, queryset):
+        users = set(queryset.values_list('user', flat=True))
+        super().delete_queryset(request, queryset)
+        ShoppingListItem.objects.refresh(users)
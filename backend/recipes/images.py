@@ -0,0 +1,124 @@
+import io
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'images/variants'
+# Наибольшие ширина и высота уменьшенных копий, пропорции сохраняются.
+IMAGE_VARIANTS = {
+    'thumbnail': (160, 160),
+    'card': (480, 480),
+    'full': (1280, 1280),
+}
+IMAGE_FORMATS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+IMAGE_QUALITY = 80
+
+_executor = None
+
+
+def get_variants_dir(name):
+    return f'{VARIANTS_DIR}/{PurePosixPath(name).stem}'
+
+
+def render_variants(path):
+    """Уменьшенные копии изображения из файла path во всех форматах.
+
+    Выполняется в отдельном процессе, поэтому не обращается к Django
+    и сам читает файл с диска.
+    """
+    variants = {}
+    with Image.open(path) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        for variant, size in IMAGE_VARIANTS.items():
+            copy = image.copy()
+            copy.thumbnail(size)
+            variants[variant] = {}
+            for extension, image_format in IMAGE_FORMATS.items():
+                buffer = io.BytesIO()
+                copy.save(buffer, image_format, quality=IMAGE_QUALITY)
+                variants[variant][extension] = buffer.getvalue()
+    return variants
+
+
+def save_variants(recipe_id, name, variants):
+    from .models import Recipe
+
+    directory = get_variants_dir(name)
+    paths = {
+        variant: {
+            extension: default_storage.save(
+                f'{directory}/{variant}.{extension}', ContentFile(content)
+            )
+            for extension, content in formats.items()
+        }
+        for variant, formats in variants.items()
+    }
+    # Изображение могло смениться, пока копии готовились.
+    Recipe.objects.filter(pk=recipe_id, image=name).update(
+        image_variants=paths
+    )
+
+
+def on_rendered(recipe_id, name, future):
+    try:
+        save_variants(recipe_id, name, future.result())
+    except Exception:
+        logger.exception('Image variants of recipe %s failed', recipe_id)
+    finally:
+        connection.close()
+
+
+def get_executor():
+    """Пул процессов для Pillow, один на процесс веб-сервера.
+
+    Процессы запускаются через spawn: fork внутри многопоточного
+    сервера копирует захваченные другими потоками блокировки.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            settings.IMAGE_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+    return _executor
+
+
+def create_variants(recipe_id, name):
+    """Готовит уменьшенные копии изображения рецепта.
+
+    При IMAGE_WORKERS > 0 Pillow работает в пуле процессов, а копии
+    сохраняются по готовности, иначе - сразу в текущем потоке. Ошибки
+    пишутся в лог: запись рецепта к этому моменту уже завершена.
+    """
+    try:
+        path = default_storage.path(name)
+        if not settings.IMAGE_WORKERS:
+            save_variants(recipe_id, name, render_variants(path))
+            return
+        get_executor().submit(render_variants, path).add_done_callback(
+            partial(on_rendered, recipe_id, name)
+        )
+    except Exception:
+        logger.exception('Image variants of recipe %s failed', recipe_id)
+
+
+def variants_are_current(recipe):
+    directory = get_variants_dir(recipe.image.name) + '/'
+    return bool(recipe.image_variants) and all(
+        path.startswith(directory)
+        for formats in recipe.image_variants.values()
+        for path in formats.values()
+    )
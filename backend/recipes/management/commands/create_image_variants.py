@@ -0,0 +1,50 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from recipes.images import render_variants, save_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Create thumbnail, card and full image variants of recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument(
+            '--workers', type=int, default=settings.IMAGE_WORKERS or 1
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Recreate variants that already exist',
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').order_by('id').only(
+            'id', 'image', 'image_variants'
+        )
+        if not options['all']:
+            recipes = recipes.filter(image_variants={})
+        recipes = recipes.iterator()
+        total = 0
+        with ProcessPoolExecutor(options['workers']) as executor:
+            for batch in iter(
+                    lambda: list(islice(recipes, options['batch_size'])), []
+            ):
+                paths = [
+                    default_storage.path(recipe.image.name)
+                    for recipe in batch
+                ]
+                for recipe, variants in zip(
+                        batch, executor.map(render_variants, paths)
+                ):
+                    save_variants(recipe.id, recipe.image.name, variants)
+                total += len(batch)
+                self.stdout.write(f'{total} recipes processed')
+        self.stdout.write(self.style.SUCCESS(
+            f'Image variants created for {total} recipes'
+        ))
@@ -0,0 +1,47 @@
+from datetime import timedelta
+from itertools import islice
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.storage import walk_files
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete recipe image files that no recipe references, '
+        'including stale image variants'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--min-age', type=int, default=60,
+            help='Keep files modified less than this many minutes ago'
+        )
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(minutes=options['min_age'])
+        references = Recipe.objects.get_media_references()
+        root = Recipe._meta.get_field('image').upload_to.rstrip('/')
+        orphans = (
+            name for name in walk_files(default_storage, root)
+            if name not in references
+            and default_storage.get_modified_time(name) < cutoff
+        )
+        total = 0
+        for batch in iter(
+                lambda: list(islice(orphans, options['batch_size'])), []
+        ):
+            if not options['dry_run']:
+                for name in batch:
+                    default_storage.delete(name)
+            total += len(batch)
+            self.stdout.write(f'{total} files processed')
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Found" if options["dry_run"] else "Deleted"} '
+            f'{total} orphan files'
+        ))
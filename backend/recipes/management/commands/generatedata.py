@@ -0,0 +1,212 @@
+import csv
+import io
+import random
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientAmount,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+    TimelineEntry
+)
+from users.models import Subscribe, User
+
+IMAGE_NAME = 'images/generated.png'
+PASSWORD = 'generated-password'
+ZIPF_EXPONENT = 1.1
+
+
+class Command(BaseCommand):
+    help = 'Generate a deterministic synthetic dataset with bulk inserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Average favorites per user'
+        )
+        parser.add_argument(
+            '--carts', type=int, default=5,
+            help='Average shopping cart size per user'
+        )
+        parser.add_argument(
+            '--subscriptions', type=int, default=10,
+            help='Average followed authors per user'
+        )
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.prefix = f'generated{options["seed"]}_'
+        if User.objects.filter(username__startswith=self.prefix).exists():
+            raise CommandError(
+                f'Dataset with seed {options["seed"]} already exists'
+            )
+        self.image = self.save_image()
+        with transaction.atomic():
+            tags = self.load_catalogue(Tag, 'tags.csv')
+            ingredients = self.load_catalogue(Ingredient, 'ingredients.csv')
+            users = self.create_users(options['users'])
+            recipes = self.create_recipes(
+                users,
+                tags,
+                ingredients,
+                options['recipes'],
+                options['ingredients_per_recipe'],
+            )
+            for model, average in (
+                (Favorite, options['favorites']),
+                (ShoppingCart, options['carts']),
+            ):
+                self.create_user_recipes(model, users, recipes, average)
+            ShoppingListItem.objects.refresh(users)
+            Recipe.objects.filter(pk__in=recipes).reconcile_favorites_count()
+            self.create_subscriptions(users, options['subscriptions'])
+            TimelineEntry.objects.rebuild(users)
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {len(users)} users and {len(recipes)} recipes '
+            f'with seed {options["seed"]}'
+        ))
+
+    def bulk_create(self, model, objects):
+        model.objects.bulk_create(
+            objects, batch_size=self.batch_size, ignore_conflicts=True
+        )
+
+    def load_catalogue(self, model, csv_name):
+        with open(
+                f'{settings.BASE_DIR}/data/{csv_name}',
+                'r',
+                encoding='utf-8'
+        ) as csv_file:
+            self.bulk_create(
+                model, [model(**row) for row in csv.DictReader(csv_file)]
+            )
+        return list(model.objects.order_by('id').values_list('id', flat=True))
+
+    def create_users(self, count):
+        password = make_password(PASSWORD)
+        self.bulk_create(User, [
+            User(
+                username=f'{self.prefix}{index}',
+                email=f'{self.prefix}{index}@example.com',
+                first_name='Пользователь',
+                last_name=str(index),
+                password=password,
+            ) for index in range(count)
+        ])
+        return list(
+            User.objects.filter(
+                username__startswith=self.prefix
+            ).order_by('id').values_list('id', flat=True)
+        )
+
+    def create_recipes(self, users, tags, ingredients, count, per_recipe):
+        self.bulk_create(Recipe, [
+            Recipe(
+                author_id=self.rng.choice(users),
+                name=f'Рецепт {index}',
+                image=self.image,
+                text='Сгенерированное описание рецепта.',
+                cooking_time=self.rng.randint(1, 180),
+            ) for index in range(count)
+        ])
+        recipes = list(
+            Recipe.objects.filter(
+                author__username__startswith=self.prefix
+            ).order_by('id').values_list('id', flat=True)
+        )
+        self.bulk_create(Recipe.tags.through, [
+            Recipe.tags.through(recipe_id=recipe, tag_id=tag)
+            for recipe in recipes
+            for tag in self.rng.sample(
+                tags, self.rng.randint(1, len(tags))
+            )
+        ])
+        self.bulk_create(IngredientAmount, [
+            IngredientAmount(
+                recipe_id=recipe,
+                ingredient_id=ingredient,
+                amount=self.rng.randint(1, 500),
+            )
+            for recipe in recipes
+            for ingredient in self.rng.sample(
+                ingredients, min(per_recipe, len(ingredients))
+            )
+        ])
+        return recipes
+
+    def get_popularity(self, items):
+        """Накопленные веса Zipf для случайно перемешанных items."""
+        items = list(items)
+        self.rng.shuffle(items)
+        weights = accumulate(
+            1 / rank ** ZIPF_EXPONENT for rank in range(1, len(items) + 1)
+        )
+        return items, list(weights)
+
+    def sample_popular(self, items, cum_weights, count, exclude=None):
+        count = min(count, len(items) - (exclude is not None))
+        chosen = set()
+        for _ in range(10):
+            if len(chosen) >= count:
+                break
+            chosen.update(
+                item for item in self.rng.choices(
+                    items, cum_weights=cum_weights, k=count - len(chosen)
+                ) if item != exclude
+            )
+        if len(chosen) < count:
+            rest = [
+                item for item in items
+                if item not in chosen and item != exclude
+            ]
+            chosen.update(self.rng.sample(rest, count - len(chosen)))
+        return sorted(chosen)
+
+    def create_user_recipes(self, model, users, recipes, average):
+        items, weights = self.get_popularity(recipes)
+        self.bulk_create(model, [
+            model(user_id=user, recipe_id=recipe)
+            for user in users
+            for recipe in self.sample_popular(
+                items, weights, round(self.rng.expovariate(1 / average))
+            )
+        ] if average else [])
+
+    def create_subscriptions(self, users, average):
+        authors, weights = self.get_popularity(users)
+        self.bulk_create(Subscribe, [
+            Subscribe(user_id=user, author_id=author)
+            for user in users
+            for author in self.sample_popular(
+                authors,
+                weights,
+                round(average * self.rng.paretovariate(2) / 2),
+                exclude=user,
+            )
+        ] if average else [])
+
+    @staticmethod
+    def save_image():
+        image = io.BytesIO()
+        Image.new('RGB', (600, 400), '#e26c2d').save(image, 'PNG')
+        return default_storage.save(
+            IMAGE_NAME, ContentFile(image.getvalue())
+        )
@@ -1,7 +1,9 @@
 import csv
+from itertools import islice
 
 from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
 from recipes.models import Ingredient, Tag
 
@@ -14,6 +16,14 @@ MODELS = {
 class Command(BaseCommand):
     help = 'Import csv files into database'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would be imported and roll back',
+        )
+
     def handle(self, *args, **options):
         for model, csv_name in MODELS.items():
             try:
@@ -22,22 +32,19 @@ class Command(BaseCommand):
                         'r',
                         encoding='utf-8'
                 ) as csv_file:
-                    data = csv.DictReader(csv_file)
-                    count = sum(
-                        [
-                            item for _, item in [
-                                model.objects.get_or_create(
-                                    **row
-                                ) for row in data
-                            ]
-                        ]
+                    total, added = self.import_rows(
+                        model,
+                        csv.DictReader(csv_file),
+                        options['batch_size'],
+                        options['dry_run'],
                     )
 
                 self.stdout.write(
                     self.style.SUCCESS(
-                        'Successfully import csv'
-                        ' files into database: '
-                        f'{model.__name__} - {count} row added.'
+                        ('Dry run, nothing saved: ' if options['dry_run']
+                         else 'Successfully import csv files into database: ')
+                        + f'{model.__name__} - {added} row added, '
+                        f'{total - added} row skipped.'
                     )
                 )
             except FileNotFoundError:
@@ -52,3 +59,20 @@ class Command(BaseCommand):
                         )
                     )
                 )
+
+    def import_rows(self, model, rows, batch_size, dry_run):
+        """Пакетная вставка строк, уже существующие строки пропускаются."""
+        total = 0
+        with transaction.atomic():
+            count_before = model.objects.count()
+            for batch in iter(lambda: list(islice(rows, batch_size)), []):
+                model.objects.bulk_create(
+                    [model(**row) for row in batch],
+                    ignore_conflicts=True,
+                )
+                total += len(batch)
+                self.stdout.write(f'{model.__name__}: {total} rows processed')
+            added = model.objects.count() - count_before
+            if dry_run:
+                transaction.set_rollback(True)
+        return total, added
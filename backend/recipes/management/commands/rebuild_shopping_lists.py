@@ -0,0 +1,33 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import ShoppingListItem
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the aggregated shopping lists from shopping carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='Rebuild only this user id, may be repeated'
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['users']:
+            users = users.filter(id__in=options['users'])
+        ids = users.values_list('id', flat=True).iterator()
+        total = 0
+        for batch in iter(
+                lambda: list(islice(ids, options['batch_size'])), []
+        ):
+            ShoppingListItem.objects.refresh(batch)
+            total += len(batch)
+            self.stdout.write(f'{total} users processed')
+        self.stdout.write(self.style.SUCCESS(
+            f'Shopping lists rebuilt for {total} users'
+        ))
@@ -0,0 +1,43 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import FavoritesCounterShard, Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Fold favorites counter shards into Recipe.favorites_count and '
+        'repair counters that drifted from the favorites table'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--flush-only',
+            action='store_true',
+            help='Only fold counter shards, without recounting favorites',
+        )
+
+    def handle(self, *args, **options):
+        if options['flush_only']:
+            ids = FavoritesCounterShard.objects.order_by(
+                'recipe'
+            ).values_list('recipe', flat=True).distinct()
+        else:
+            ids = Recipe.objects.order_by('id').values_list('id', flat=True)
+        ids = ids.iterator()
+        processed = changed = 0
+        for batch in iter(
+                lambda: list(islice(ids, options['batch_size'])), []
+        ):
+            queryset = Recipe.objects.filter(pk__in=batch)
+            if options['flush_only']:
+                changed += queryset.flush_favorites_counter_shards()
+            else:
+                changed += queryset.reconcile_favorites_count()
+            processed += len(batch)
+            self.stdout.write(f'{processed} recipes processed')
+        self.stdout.write(self.style.SUCCESS(
+            f'{changed} of {processed} recipe counters updated'
+        ))
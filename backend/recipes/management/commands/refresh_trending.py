@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.models import FavoriteBucket
+
+
+class Command(BaseCommand):
+    help = (
+        'Refresh hourly favorite buckets since the last run and the '
+        'trending score of recipes; run it periodically, e.g. from cron'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help=(
+                'Recount the whole window, also drops favorites removed '
+                'after their bucket was counted'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        updated = FavoriteBucket.objects.refresh(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Trending score of {updated} recipes refreshed for the last '
+            f'{settings.TRENDING_WINDOW_DAYS} days'
+        ))
@@ -0,0 +1,48 @@
+# Generated by Django 3.2.3 on 2026-10-18 03:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_recipe_favorites_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FavoriteBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(db_index=True, verbose_name='Час')),
+                ('count', models.PositiveIntegerField(verbose_name='Добавлений в избранное')),
+            ],
+            options={
+                'verbose_name': 'Корзина избранного',
+                'verbose_name_plural': 'Корзины избранного',
+            },
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='trending_score',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлений в избранное за период'),
+        ),
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['add_date'], name='favorite_add_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-trending_score', '-id'], name='recipe_trending_score_id_idx'),
+        ),
+        migrations.AddField(
+            model_name='favoritebucket',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='favoritebuckets', to='recipes.recipe', verbose_name='Рецепт'),
+        ),
+        migrations.AddConstraint(
+            model_name='favoritebucket',
+            constraint=models.UniqueConstraint(fields=('recipe', 'hour'), name='unique_favorite_bucket_recipe_hour'),
+        ),
+    ]
@@ -1,11 +1,20 @@
+import random
+from collections import defaultdict
+from datetime import timedelta
+
 from colorfield.fields import ColorField
-from django.db import models
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
 from django.core.validators import (
     MaxValueValidator,
     MinValueValidator,
 )
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, RowNumber, TruncHour
+from django.utils import timezone
 
-from users.models import User
+from users.models import Subscribe, User
+from core.querysets import UserLinkQuerySet
 from core.constant import (
     BLUE,
     GREEN,
@@ -77,6 +86,123 @@ class Ingredient(models.Model):
         return f'{self.name}, {self.measurement_unit}'
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def latest_by_author(self, limit):
+        """Не более limit последних рецептов каждого автора одним запросом."""
+        ranked = self.order_by().annotate(
+            position=models.Window(
+                expression=RowNumber(),
+                partition_by=models.F('author'),
+                order_by=(
+                    models.F('pub_date').desc(),
+                    models.F('id').desc(),
+                ),
+            )
+        ).values(
+            'id', 'author_id', 'name', 'image', 'image_variants',
+            'cooking_time', 'pub_date', 'position'
+        )
+        sql, params = ranked.query.sql_with_params()
+        return self.model.objects.raw(
+            f'SELECT * FROM ({sql}) AS ranked '
+            'WHERE ranked.position <= %s '
+            'ORDER BY ranked.author_id, ranked.position',
+            (*params, limit)
+        )
+
+    def change_favorites_count(self, recipe_id, delta):
+        """Изменяет счётчик избранного рецепта на delta.
+
+        При FAVORITES_COUNTER_SHARDS изменение пишется в случайную ячейку
+        FavoritesCounterShard, чтобы одновременные добавления в избранное
+        не ждали блокировку одной строки рецепта.
+        """
+        if not settings.FAVORITES_COUNTER_SHARDS:
+            self.filter(pk=recipe_id).update(
+                favorites_count=F('favorites_count') + delta
+            )
+            return
+        shard = random.randrange(settings.FAVORITES_COUNTER_SHARDS)
+        shards = FavoritesCounterShard.objects.filter(
+            recipe_id=recipe_id, shard=shard
+        )
+        if shards.update(count=F('count') + delta):
+            return
+        try:
+            with transaction.atomic():
+                shards.create(recipe_id=recipe_id, shard=shard, count=delta)
+        except IntegrityError:
+            shards.update(count=F('count') + delta)
+
+    def bulk_change_favorites_count(self, recipe_ids, delta):
+        """Изменяет на delta счётчики избранного нескольких рецептов."""
+        if settings.FAVORITES_COUNTER_SHARDS:
+            for recipe_id in recipe_ids:
+                self.change_favorites_count(recipe_id, delta)
+            return
+        self.filter(pk__in=recipe_ids).update(
+            favorites_count=F('favorites_count') + delta
+        )
+
+    def flush_favorites_counter_shards(self):
+        """Переносит накопленные в ячейках изменения в favorites_count."""
+        with transaction.atomic():
+            shards = list(
+                FavoritesCounterShard.objects.select_for_update().filter(
+                    recipe__in=self
+                ).values_list('pk', 'recipe', 'count')
+            )
+            totals = {}
+            for _, recipe, count in shards:
+                totals[recipe] = totals.get(recipe, 0) + count
+            for recipe, total in totals.items():
+                self.model.objects.filter(pk=recipe).update(
+                    favorites_count=F('favorites_count') + total
+                )
+            FavoritesCounterShard.objects.filter(
+                pk__in=[pk for pk, _, _ in shards]
+            ).delete()
+        return len(totals)
+
+    def reconcile_favorites_count(self):
+        """Пересчитывает favorites_count по таблице избранного.
+
+        Возвращает число рецептов, у которых счётчик расходился.
+        """
+        actual = Coalesce(
+            Subquery(
+                Favorite.objects.filter(
+                    recipe=OuterRef('pk')
+                ).order_by().values('recipe').annotate(
+                    count=Count('pk')
+                ).values('count')
+            ),
+            0,
+        )
+        with transaction.atomic():
+            FavoritesCounterShard.objects.filter(recipe__in=self).delete()
+            return self.model.objects.filter(
+                pk__in=self.annotate(actual=actual).exclude(
+                    favorites_count=F('actual')
+                ).values('pk')
+            ).update(favorites_count=actual)
+
+    def get_media_references(self):
+        """Имена файлов изображений и их копий, на которые есть ссылки."""
+        references = set()
+        for image, variants in self.values_list(
+            'image', 'image_variants'
+        ).iterator():
+            references.add(image)
+            references.update(
+                path
+                for formats in variants.values()
+                for path in formats.values()
+            )
+        return references
+
+
 class Recipe(models.Model):
     tags = models.ManyToManyField(
         verbose_name='Тэг',
@@ -103,6 +229,11 @@ class Recipe(models.Model):
         verbose_name='Изображение',
         upload_to='images/',
     )
+    image_variants = models.JSONField(
+        verbose_name='Уменьшенные копии изображения',
+        default=dict,
+        editable=False,
+    )
     text = models.TextField(
         verbose_name='Описание',
     )
@@ -125,11 +256,47 @@ class Recipe(models.Model):
         auto_now_add=True,
         editable=False,
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False,
+    )
+    trending_score = models.PositiveIntegerField(
+        verbose_name='Добавлений в избранное за период',
+        default=0,
+        editable=False,
+    )
+    fanned_out = models.BooleanField(
+        verbose_name='Разослан в ленты подписчиков',
+        default=True,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=('-favorites_count', '-id'),
+                name='recipe_favorites_count_id_idx',
+            ),
+            models.Index(
+                fields=('-trending_score', '-id'),
+                name='recipe_trending_score_id_idx',
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_pulled_feed_idx',
+                condition=models.Q(fanned_out=False),
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -152,6 +319,8 @@ class UserRecipeAdddateModel(models.Model):
         editable=False,
     )
 
+    objects = UserLinkQuerySet.as_manager()
+
     class Meta:
         abstract = True
         ordering = ('-add_date',)
@@ -172,6 +341,12 @@ class Favorite(UserRecipeAdddateModel):
         default_related_name = 'favorites'
         verbose_name = 'Избранный рецепт'
         verbose_name_plural = 'Избранные рецепты'
+        indexes = (
+            models.Index(
+                fields=('add_date',),
+                name='favorite_add_date_idx',
+            ),
+        )
 
     def __str__(self) -> str:
         return f'{self.user} любит {self.recipe}'
@@ -185,6 +360,253 @@ class ShoppingCart(UserRecipeAdddateModel):
         verbose_name_plural = 'Списки покупок'
 
 
+class FavoritesCounterShard(models.Model):
+    """Ячейка счётчика избранного, ещё не перенесённая в рецепт."""
+    recipe = models.ForeignKey(
+        verbose_name='Рецепт',
+        to=Recipe,
+        related_name='favoritescountershards',
+        on_delete=models.CASCADE,
+    )
+    shard = models.PositiveSmallIntegerField(
+        verbose_name='Номер ячейки',
+    )
+    count = models.IntegerField(
+        verbose_name='Изменение счётчика',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Ячейка счётчика избранного'
+        verbose_name_plural = 'Ячейки счётчика избранного'
+        constraints = (
+            models.UniqueConstraint(
+                fields=(
+                    'recipe',
+                    'shard',
+                ),
+                name='unique_favorites_counter_shard',
+            ),
+        )
+
+
+class FavoriteBucketQuerySet(models.QuerySet):
+
+    def refresh(self, full=False):
+        """Пересчитывает часовые корзины избранного и trending_score.
+
+        По умолчанию пересчитываются корзины начиная с последней
+        сохранённой, full пересчитывает всё окно TRENDING_WINDOW_DAYS.
+        Корзины старше окна удаляются.
+        """
+        window_start = (
+            timezone.now() - timedelta(days=settings.TRENDING_WINDOW_DAYS)
+        ).replace(minute=0, second=0, microsecond=0)
+        with transaction.atomic():
+            since = None if full else self.aggregate(
+                latest=models.Max('hour')
+            )['latest']
+            since = max(since or window_start, window_start)
+            self.filter(
+                models.Q(hour__lt=window_start) | models.Q(hour__gte=since)
+            ).delete()
+            self.bulk_create(
+                self.model(
+                    recipe_id=row['recipe'],
+                    hour=row['bucket'],
+                    count=row['count'],
+                ) for row in Favorite.objects.filter(
+                    add_date__gte=since
+                ).annotate(bucket=TruncHour('add_date')).values(
+                    'recipe', 'bucket'
+                ).annotate(count=Count('pk')).order_by()
+            )
+            Recipe.objects.filter(trending_score__gt=0).exclude(
+                pk__in=self.values('recipe')
+            ).update(trending_score=0)
+            return Recipe.objects.filter(
+                pk__in=self.values('recipe')
+            ).update(trending_score=Subquery(
+                self.filter(recipe=OuterRef('pk')).order_by().values(
+                    'recipe'
+                ).annotate(total=Sum('count')).values('total')
+            ))
+
+
+class FavoriteBucket(models.Model):
+    """Число добавлений рецепта в избранное за час."""
+    recipe = models.ForeignKey(
+        verbose_name='Рецепт',
+        to=Recipe,
+        related_name='favoritebuckets',
+        on_delete=models.CASCADE,
+    )
+    hour = models.DateTimeField(
+        verbose_name='Час',
+        db_index=True,
+    )
+    count = models.PositiveIntegerField(
+        verbose_name='Добавлений в избранное',
+    )
+
+    objects = FavoriteBucketQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Корзина избранного'
+        verbose_name_plural = 'Корзины избранного'
+        constraints = (
+            models.UniqueConstraint(
+                fields=(
+                    'recipe',
+                    'hour',
+                ),
+                name='unique_favorite_bucket_recipe_hour',
+            ),
+        )
+
+
+class TimelineEntryQuerySet(models.QuerySet):
+
+    def fan_out(self, recipe):
+        """Добавляет новый рецепт в ленты подписчиков автора.
+
+        Рецепты авторов с числом подписчиков больше
+        FEED_FANOUT_MAX_FOLLOWERS не рассылаются, а подмешиваются
+        в ленту при чтении.
+        """
+        followers = list(
+            Subscribe.objects.filter(
+                author=recipe.author_id
+            ).values_list('user', flat=True)[
+                :settings.FEED_FANOUT_MAX_FOLLOWERS + 1
+            ]
+        )
+        if len(followers) > settings.FEED_FANOUT_MAX_FOLLOWERS:
+            recipe.fanned_out = False
+            Recipe.objects.filter(pk=recipe.pk).update(fanned_out=False)
+            return
+        self.bulk_create(
+            (
+                self.model(
+                    user_id=user,
+                    recipe_id=recipe.pk,
+                    author_id=recipe.author_id,
+                    pub_date=recipe.pub_date,
+                ) for user in followers
+            ),
+            batch_size=1000,
+        )
+
+    def backfill(self, user_id, authors):
+        """Добавляет в ленту последние рецепты новых авторов."""
+        self.bulk_create(
+            (
+                self.model(
+                    user_id=user_id,
+                    recipe_id=recipe.id,
+                    author_id=recipe.author_id,
+                    pub_date=recipe.pub_date,
+                ) for recipe in Recipe.objects.filter(
+                    author__in=authors, fanned_out=True
+                ).latest_by_author(settings.FEED_BACKFILL_LIMIT)
+            ),
+            ignore_conflicts=True,
+        )
+
+    def rebuild(self, users):
+        """Пересобирает ленты users по их подпискам."""
+        followers = defaultdict(list)
+        for user, author in Subscribe.objects.filter(
+                user__in=users
+        ).values_list('user', 'author'):
+            followers[author].append(user)
+        with transaction.atomic(savepoint=False):
+            self.filter(user__in=users).delete()
+            self.bulk_create(
+                (
+                    self.model(
+                        user_id=user,
+                        recipe_id=recipe.id,
+                        author_id=recipe.author_id,
+                        pub_date=recipe.pub_date,
+                    )
+                    for recipe in Recipe.objects.filter(
+                        author__in=list(followers), fanned_out=True
+                    ).latest_by_author(settings.FEED_BACKFILL_LIMIT)
+                    for user in followers[recipe.author_id]
+                ),
+                batch_size=1000,
+            )
+
+    def get_sources(self, user):
+        """Выборки для ленты user: разосланные и подмешиваемые рецепты.
+
+        Каждая выборка упорядочивается по (-pub_date, -<поле id>).
+        """
+        return (
+            (self.filter(user=user), 'recipe_id'),
+            (
+                Recipe.objects.filter(
+                    author__in=Subscribe.objects.filter(
+                        user=user
+                    ).values('author'),
+                    fanned_out=False,
+                ),
+                'id',
+            ),
+        )
+
+
+class TimelineEntry(models.Model):
+    """Рецепт в ленте подписок пользователя."""
+    user = models.ForeignKey(
+        verbose_name='Пользователь',
+        to=User,
+        related_name='timelineentries',
+        on_delete=models.CASCADE,
+    )
+    recipe = models.ForeignKey(
+        verbose_name='Рецепт',
+        to=Recipe,
+        related_name='timelineentries',
+        on_delete=models.CASCADE,
+    )
+    author = models.ForeignKey(
+        verbose_name='Автор',
+        to=User,
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    objects = TimelineEntryQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        constraints = (
+            models.UniqueConstraint(
+                fields=(
+                    'user',
+                    'recipe',
+                ),
+                name='unique_timeline_user_recipe',
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='timeline_user_pub_date_idx',
+            ),
+            models.Index(
+                fields=('user', 'author'),
+                name='timeline_user_author_idx',
+            ),
+        )
+
+
 class IngredientAmount(models.Model):
     recipe = models.ForeignKey(
         verbose_name='Рецепт',
@@ -229,3 +651,79 @@ class IngredientAmount(models.Model):
 
     def __str__(self) -> str:
         return f'{self.ingredient} в количестве {self.amount}.'
+
+
+class ShoppingListItemQuerySet(models.QuerySet):
+
+    def refresh(self, users, ingredients=None):
+        """Пересчитывает списки покупок users по ингредиентам ingredients.
+
+        users и ingredients - id или подзапросы, без ingredients
+        список пересчитывается целиком. Строки пользователей блокируются,
+        чтобы одновременные пересчёты одного списка шли по очереди.
+        """
+        items = self.filter(user__in=users)
+        amounts = IngredientAmount.objects.filter(
+            recipe__shoppingcarts__user__in=users
+        )
+        if ingredients is not None:
+            items = items.filter(ingredient__in=ingredients)
+            amounts = amounts.filter(ingredient__in=ingredients)
+        with transaction.atomic(savepoint=False):
+            list(
+                User.objects.select_for_update().filter(
+                    pk__in=users
+                ).order_by('pk').values_list('pk', flat=True)
+            )
+            items.delete()
+            self.bulk_create(
+                self.model(
+                    user_id=row['recipe__shoppingcarts__user'],
+                    ingredient_id=row['ingredient'],
+                    amount=row['total'],
+                    recipes_count=row['recipes'],
+                ) for row in amounts.values(
+                    'recipe__shoppingcarts__user', 'ingredient'
+                ).annotate(
+                    total=Sum('amount'), recipes=Count('recipe')
+                ).order_by()
+            )
+
+
+class ShoppingListItem(models.Model):
+    """Сумма ингредиента по всем рецептам в корзине пользователя."""
+    user = models.ForeignKey(
+        verbose_name='Пользователь',
+        to=User,
+        on_delete=models.CASCADE,
+    )
+    ingredient = models.ForeignKey(
+        verbose_name='Ингридиент',
+        to=Ingredient,
+        on_delete=models.CASCADE,
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество',
+    )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов',
+    )
+
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    class Meta:
+        default_related_name = 'shoppinglistitems'
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списков покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=(
+                    'user',
+                    'ingredient',
+                ),
+                name='unique_shopping_list_user_ingredient',
+            ),
+        )
+
+    def __str__(self) -> str:
+        return f'{self.ingredient} в количестве {self.amount}.'
@@ -0,0 +1,119 @@
+import io
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from recipes.images import IMAGE_VARIANTS
+from recipes.models import Recipe
+from users.models import User
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class DeleteOrphanMediaTests(TestCase):
+
+    def setUp(self):
+        self.addCleanup(shutil.rmtree, settings.MEDIA_ROOT, True)
+        author = User.objects.create(
+            username='author', email='author@example.com'
+        )
+        self.image = self.create_file('images/used.png')
+        self.variant = self.create_file('images/variants/used/card.webp')
+        Recipe.objects.create(
+            author=author,
+            name='Рецепт',
+            text='Описание',
+            image=self.image,
+            image_variants={'card': {'webp': self.variant}},
+        )
+        self.orphan = self.create_file('images/orphan.png')
+        self.orphan_variant = self.create_file(
+            'images/variants/orphan/card.webp'
+        )
+        self.fresh = self.create_file('images/fresh.png', age=0)
+
+    @staticmethod
+    def create_file(name, age=2 * 60 * 60):
+        name = default_storage.save(name, ContentFile(name.encode()))
+        modified = time.time() - age
+        os.utime(default_storage.path(name), (modified, modified))
+        return name
+
+    def delete_orphan_media(self, *args):
+        stdout = io.StringIO()
+        call_command('delete_orphan_media', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_deletes_old_unreferenced_files(self):
+        output = self.delete_orphan_media()
+        self.assertFalse(default_storage.exists(self.orphan))
+        self.assertFalse(default_storage.exists(self.orphan_variant))
+        self.assertIn('Deleted 2 orphan files', output)
+
+    def test_keeps_referenced_and_fresh_files(self):
+        self.delete_orphan_media()
+        self.assertTrue(default_storage.exists(self.image))
+        self.assertTrue(default_storage.exists(self.variant))
+        self.assertTrue(default_storage.exists(self.fresh))
+
+    def test_min_age(self):
+        self.delete_orphan_media('--min-age', '180')
+        self.assertTrue(default_storage.exists(self.orphan))
+        self.delete_orphan_media('--min-age', '0')
+        self.assertFalse(default_storage.exists(self.fresh))
+        self.assertTrue(default_storage.exists(self.image))
+
+    def test_dry_run_deletes_nothing(self):
+        output = self.delete_orphan_media('--dry-run')
+        self.assertIn('Found 2 orphan files', output)
+        for name in (self.orphan, self.orphan_variant, self.fresh):
+            self.assertTrue(default_storage.exists(name))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), IMAGE_WORKERS=0)
+class ImageVariantsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='author', email='author@example.com'
+        )
+
+    def setUp(self):
+        self.addCleanup(shutil.rmtree, settings.MEDIA_ROOT, True)
+
+    def create_recipe(self, image):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                author=self.author,
+                name='Рецепт',
+                text='Описание',
+                image=image,
+            )
+        recipe.refresh_from_db()
+        return recipe
+
+    def test_variants_are_created(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (600, 300)).save(buffer, 'PNG')
+        image = default_storage.save('images/a.png', ContentFile(
+            buffer.getvalue()
+        ))
+        recipe = self.create_recipe(image)
+        self.assertEqual(set(recipe.image_variants), set(IMAGE_VARIANTS))
+        with Image.open(
+                default_storage.path(recipe.image_variants['card']['webp'])
+        ) as card:
+            self.assertEqual(card.size, (480, 240))
+
+    def test_missing_file_is_logged(self):
+        with self.assertLogs('recipes.images', 'ERROR'):
+            recipe = self.create_recipe('images/missing.png')
+        self.assertEqual(recipe.image_variants, {})
@@ -2,6 +2,7 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 
 from core.constant import LENGTH_EMAIL, LENGTH_USER
+from core.querysets import UserLinkQuerySet
 from core.validators import validate_username
 
 
@@ -56,6 +57,8 @@ class Subscribe(models.Model):
         on_delete=models.CASCADE,
     )
 
+    objects = UserLinkQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'